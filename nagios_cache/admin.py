@@ -1,19 +1,135 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import cached_property
 
-from nagios_cache.models import NagiosServiceStatus, NagiosHostStatus, NagiosHostgroup
-from nagios_cache.models import NagiosServicegroup
+from nagios_cache import queries
+from nagios_cache.cache import get_cache, make_key
+from nagios_cache.models import NagiosStatus, NagiosServiceStatus, NagiosHostStatus, NagiosHostgroup
+from nagios_cache.models import NagiosServicegroup, NagiosStatusSummary
+
+# Unfiltered tables with more rows than this are counted with the estimate of the database
+ESTIMATE_THRESHOLD = 10000
+
+
+def estimated_count(model):
+    """
+    The number of rows of the table of model as estimated by PostgreSQL or MySQL, None for other databases
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [model._meta.db_table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [model._meta.db_table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator for the large tables. The number of rows of a changelist is cached until the next sync,
+    unfiltered large tables use the estimate of the database instead of a COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list
+        if not query.query.where:
+            estimate = estimated_count(query.model)
+            if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+                return estimate
+        cache = get_cache()
+        key = make_key('admin_count', str(query.query))
+        count = cache.get(key)
+        if count is None:
+            count = query.count()
+            cache.set(key, count, settings.NAGIOS_CACHE_QUERY_TIMEOUT)
+        return count
+
+
+class StatusFilter(admin.SimpleListFilter):
+    """
+    Filter by status with the number of entries per status, cached until the next sync
+    """
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        counts = model_admin.count_by_status()
+        return [(code, '%s (%s)' % (name, counts[code])) for code, name in NagiosStatus.STATUS if code in counts]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(status=self.value())
+        return queryset
+
+
+class GroupFilter(admin.SimpleListFilter):
+    """
+    Filter by the membership in a group, looked up in the many to many table of the group
+    """
+    group_model = None
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        return list(self.group_model.objects.order_by('name').values_list('id', 'name'))
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup: self.value()})
+        return queryset
+
+
+class HostgroupFilter(GroupFilter):
+    title = 'hostgroup'
+    parameter_name = 'hostgroup'
+    group_model = NagiosHostgroup
+    lookup = 'nagioshostgroup'
+
+
+class ServiceHostgroupFilter(HostgroupFilter):
+    lookup = 'host__nagioshostgroup'
+
+
+class ServicegroupFilter(GroupFilter):
+    title = 'servicegroup'
+    parameter_name = 'servicegroup'
+    group_model = NagiosServicegroup
+    lookup = 'nagiosservicegroup'
 
 
 class NagiosHostStatusAdmin(admin.ModelAdmin):
-    list_filter = ['status']
+    list_filter = [StatusFilter, HostgroupFilter]
     list_display = ['host_name', 'status', 'has_been_acknowledged', 'status_information', 'last_check']
-    search_fields = ['host_name', 'status_information']
+    search_fields = ['host_name']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def get_search_fields(self, request):
+        # Searching the status_information scans the complete table, so it has to be enabled
+        if settings.NAGIOS_CACHE_ADMIN_SEARCH_STATUS_INFORMATION:
+            return self.search_fields + ['status_information']
+        return self.search_fields
+
+    @staticmethod
+    def count_by_status():
+        return queries.count_hosts_by_status()
 
 
 class NagiosServiceStatusAdmin(NagiosHostStatusAdmin):
+    list_filter = [StatusFilter, ServiceHostgroupFilter, ServicegroupFilter]
     list_display = ['host', 'service_description'] + NagiosHostStatusAdmin.list_display
+    list_select_related = ['host']
     search_fields = ['service_description'] + NagiosHostStatusAdmin.search_fields
 
+    @staticmethod
+    def count_by_status():
+        return queries.count_by_status()
+
 
 class NagiosHostgroupAdmin(admin.ModelAdmin):
     list_display = ['name']
@@ -25,8 +141,20 @@ class NagiosServicegroupAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
+class NagiosStatusSummaryAdmin(admin.ModelAdmin):
+    list_filter = ['kind']
+    list_display = ['name', 'kind', 'total', 'ok', 'warning', 'critical', 'unknown', 'pending',
+                    'acknowledged', 'in_scheduled_downtime', 'last_database_update']
+    search_fields = ['name']
+    ordering = ['kind', 'name']
+
+    def has_add_permission(self, request):
+        # The summaries are computed by the sync
+        return False
+
+
 admin.site.register(NagiosHostStatus, NagiosHostStatusAdmin)
 admin.site.register(NagiosServiceStatus, NagiosServiceStatusAdmin)
 admin.site.register(NagiosServicegroup, NagiosServicegroupAdmin)
 admin.site.register(NagiosHostgroup, NagiosHostgroupAdmin)
-
+admin.site.register(NagiosStatusSummary, NagiosStatusSummaryAdmin)
@@ -5,16 +5,50 @@ from django.conf import settings
 
 from django.core.checks import Error, Warning, register
 
+from nagios_cache.client import streaming_enabled
+
 DEFAULT_CONFIG = {
     'NAGIOS_CACHE_URL': None,
     'NAGIOS_CACHE_USER': None,
     'NAGIOS_CACHE_PASSWORD': None,
+    'NAGIOS_CACHE_SOURCES': None,
     'NAGIOS_CACHE_CLEANCOMMAND_DAYS': 1,
     'NAGIOS_CACHE_CLEANCOMMAND_HOURS': 0,
     'NAGIOS_CACHE_AUTOCLEAN': False,
     'NAGIOS_CACHE_AUTOCLEAN_DAYS': 1,
+    'NAGIOS_CACHE_CLEAN_BATCH_SIZE': 1000,
+    'NAGIOS_CACHE_BATCH_SIZE': 500,
+    'NAGIOS_CACHE_FETCH_CONCURRENCY': 4,
+    'NAGIOS_CACHE_POOL_SIZE': 10,
+    'NAGIOS_CACHE_TIMEOUT': 120,
+    'NAGIOS_CACHE_RETRIES': 3,
+    'NAGIOS_CACHE_RETRY_BACKOFF': 0.5,
+    'NAGIOS_CACHE_STREAMING': False,
+    'NAGIOS_CACHE_SKIP_UNCHANGED': True,
+    'NAGIOS_CACHE_HOSTGROUP_SERVICES_LIMIT': 10,
+    'NAGIOS_CACHE_SYNC_STRATEGY': 'transaction',
+    'NAGIOS_CACHE_HISTORY': True,
+    'NAGIOS_CACHE_HISTORY_DAYS': 90,
+    'NAGIOS_CACHE_API_PAGE_SIZE': 1000,
+    'NAGIOS_CACHE_ADMIN_SEARCH_STATUS_INFORMATION': False,
+    'NAGIOS_CACHE_SYNCD_INTERVALS': {
+        'hosts': 60,
+        'services': 30,
+        'hostgroups': 3600,
+        'servicegroups': 3600,
+    },
+    'NAGIOS_CACHE_SYNCD_JITTER': 0.1,
+    'NAGIOS_CACHE_QUERY_CACHE': 'default',
+    'NAGIOS_CACHE_QUERY_TIMEOUT': 300,
+    'NAGIOS_CACHE_STATS_FILE': None,
 }
 
+# Cache backends that are not shared between processes, see the check nagios_cache.W004
+PROCESS_LOCAL_CACHES = [
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+]
+
 
 class NagiosCacheConfig(AppConfig):
     name = 'nagios_cache'
@@ -33,13 +67,57 @@ def config_validation(app_configs, **kwargs):
                               'settings.NAGIOS_CACHE_PASSWORD. Authentication at the Nagios/Icinga host '
                               'is disable. This is properly not what you want.',
                               id='nagios_cache.W001'))
-    if not settings.NAGIOS_CACHE_URL:
+    if not settings.NAGIOS_CACHE_URL and not settings.NAGIOS_CACHE_SOURCES:
         errors.append(Error('You must define settings.NAGIOS_CACHE_URL', id='nagios_cache.E001'))
+    if settings.NAGIOS_CACHE_SOURCES and (
+            not isinstance(settings.NAGIOS_CACHE_SOURCES, dict)
+            or not all(isinstance(config, dict) and config.get('URL') and len(name) <= 50
+                       for name, config in settings.NAGIOS_CACHE_SOURCES.items())):
+        errors.append(Error('settings.NAGIOS_CACHE_SOURCES must be a dict name -> {\'URL\': ..., \'USER\': ..., \'PASSWORD\': ...} '
+                            'with names of up to 50 characters', id='nagios_cache.E010'))
     if settings.NAGIOS_CACHE_AUTOCLEAN and not type(settings.NAGIOS_CACHE_AUTOCLEAN_DAYS) == int:
         errors.append(Error('settings.NAGIOS_CACHE_AUTOCLEAN_DAYS must be an integer', id='nagios_cache.E002'))
     if settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS == 0 and settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS == 0:
         errors.append(Error('settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS and NAGIOS_CACHE_CLEANCOMMAND_HOURS are 0. '
                             'Every nagios_clean command will wipe your database. This is properly not what you want.',
                             id='nagios_cache.E003'))
+    if not type(settings.NAGIOS_CACHE_BATCH_SIZE) == int or settings.NAGIOS_CACHE_BATCH_SIZE < 1:
+        errors.append(Error('settings.NAGIOS_CACHE_BATCH_SIZE must be a positive integer', id='nagios_cache.E004'))
+    if not type(settings.NAGIOS_CACHE_FETCH_CONCURRENCY) == int or settings.NAGIOS_CACHE_FETCH_CONCURRENCY < 1:
+        errors.append(Error('settings.NAGIOS_CACHE_FETCH_CONCURRENCY must be a positive integer', id='nagios_cache.E005'))
+    if not type(settings.NAGIOS_CACHE_POOL_SIZE) == int or settings.NAGIOS_CACHE_POOL_SIZE < 1:
+        errors.append(Error('settings.NAGIOS_CACHE_POOL_SIZE must be a positive integer', id='nagios_cache.E006'))
+    if not type(settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE) == int or settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE < 0:
+        errors.append(Error('settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE must be a positive integer or 0', id='nagios_cache.E007'))
+    if set(settings.NAGIOS_CACHE_SYNCD_INTERVALS) != set(DEFAULT_CONFIG['NAGIOS_CACHE_SYNCD_INTERVALS']):
+        errors.append(Error('settings.NAGIOS_CACHE_SYNCD_INTERVALS must define the intervals of %s'
+                            % ', '.join(sorted(DEFAULT_CONFIG['NAGIOS_CACHE_SYNCD_INTERVALS'])),
+                            id='nagios_cache.E008'))
+    if settings.NAGIOS_CACHE_QUERY_CACHE not in settings.CACHES:
+        errors.append(Error('settings.NAGIOS_CACHE_QUERY_CACHE must be the name of a cache in settings.CACHES',
+                            id='nagios_cache.E009'))
+    if not type(settings.NAGIOS_CACHE_HOSTGROUP_SERVICES_LIMIT) == int or settings.NAGIOS_CACHE_HOSTGROUP_SERVICES_LIMIT < 0:
+        errors.append(Error('settings.NAGIOS_CACHE_HOSTGROUP_SERVICES_LIMIT must be a positive integer or 0',
+                            id='nagios_cache.E011'))
+    if settings.NAGIOS_CACHE_SYNC_STRATEGY not in ('transaction', 'shadow'):
+        errors.append(Error('settings.NAGIOS_CACHE_SYNC_STRATEGY must be \'transaction\' or \'shadow\'',
+                            id='nagios_cache.E012'))
+    if not type(settings.NAGIOS_CACHE_HISTORY_DAYS) == int or settings.NAGIOS_CACHE_HISTORY_DAYS < 1:
+        errors.append(Error('settings.NAGIOS_CACHE_HISTORY_DAYS must be a positive integer', id='nagios_cache.E013'))
+    if not type(settings.NAGIOS_CACHE_API_PAGE_SIZE) == int or settings.NAGIOS_CACHE_API_PAGE_SIZE < 1:
+        errors.append(Error('settings.NAGIOS_CACHE_API_PAGE_SIZE must be a positive integer', id='nagios_cache.E014'))
+    if settings.NAGIOS_CACHE_POOL_SIZE < settings.NAGIOS_CACHE_FETCH_CONCURRENCY:
+        errors.append(Warning('settings.NAGIOS_CACHE_POOL_SIZE is smaller than NAGIOS_CACHE_FETCH_CONCURRENCY. '
+                              'Parallel downloads will open connections that can not be kept alive.',
+                              id='nagios_cache.W002'))
+    if settings.CACHES.get(settings.NAGIOS_CACHE_QUERY_CACHE, {}).get('BACKEND') in PROCESS_LOCAL_CACHES:
+        errors.append(Warning('The cache settings.NAGIOS_CACHE_QUERY_CACHE is local to every process. The web processes '
+                              'do not see the syncs of nagios_sync and nagios_syncd and show cached results for up to '
+                              'NAGIOS_CACHE_QUERY_TIMEOUT seconds. Use a shared cache like memcached or redis.',
+                              id='nagios_cache.W004'))
+    if settings.NAGIOS_CACHE_STREAMING and not streaming_enabled():
+        errors.append(Warning('settings.NAGIOS_CACHE_STREAMING is enabled but the ijson package is not installed. '
+                              'The responses will be parsed as a whole.',
+                              id='nagios_cache.W003'))
     return errors
 
@@ -0,0 +1,289 @@
+
+
+import json
+import multiprocessing
+import sys
+import random
+import time
+import tracemalloc
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+
+import requests
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The installation of the README: 20000 checks, 1500 hosts, 200 hostgroups and 10 servicegroups
+DEFAULT_SIZE = {
+    'hosts': 1500,
+    'services': 20000,
+    'hostgroups': 200,
+    'servicegroups': 10,
+}
+
+
+class StatusData(object):
+    """
+    Synthetic Icinga 1.x status data. The same arguments always generate the same data.
+    Revision 0 is the initial state. In every other revision the given fraction of the checks
+    has a new last_check and a tenth of those a new status, like between two syncs.
+    The check times are relative to now (default: the current time).
+    """
+    SERVICE_STATUS = ['OK'] * 17 + ['WARNING', 'CRITICAL', 'UNKNOWN']
+    HOST_STATUS = ['UP'] * 18 + ['DOWN', 'UNREACHABLE']
+
+    def __init__(self, hosts, services, hostgroups, servicegroups, seed=0, revision=0, changes=0.05, now=None):
+        rnd = random.Random(seed)
+        now = (now or datetime.now()).replace(microsecond=0)
+        self.hosts = [self.check(rnd, now, self.HOST_STATUS, host_name='host%05d' % i,
+                                 host_display_name='Host %s' % i)
+                      for i in range(hosts)]
+        self.services = []
+        for i in range(services):
+            host = self.hosts[i % hosts]
+            self.services.append(self.check(rnd, now, self.SERVICE_STATUS, host_name=host['host_name'],
+                                            host_display_name=host['host_display_name'],
+                                            service_description='service%03d' % (i // hosts),
+                                            service_display_name='Service %s' % (i // hosts)))
+        # Most hosts are in more than one hostgroup, half of the services are in a servicegroup
+        self.hostgroups = dict(('hostgroup%03d' % i, []) for i in range(hostgroups))
+        names = sorted(self.hostgroups)
+        for host in self.hosts:
+            for name in rnd.sample(names, min(len(names), rnd.randint(1, 4))):
+                self.hostgroups[name].append(host)
+        self.servicegroups = dict(('servicegroup%03d' % i, []) for i in range(servicegroups))
+        names = sorted(self.servicegroups)
+        for service in self.services:
+            if names and rnd.random() < 0.5:
+                self.servicegroups[rnd.choice(names)].append(service)
+        if revision:
+            rnd = random.Random('%s-%s' % (seed, revision))
+            checks = self.hosts + self.services
+            for check in rnd.sample(checks, int(len(checks) * changes)):
+                check['last_check'] = (now + timedelta(seconds=revision)).strftime('%m-%d-%Y %H:%M:%S')
+                if rnd.random() < 0.1:
+                    choices = self.SERVICE_STATUS if 'service_description' in check else self.HOST_STATUS
+                    check['status'] = rnd.choice(choices)
+                    check['duration'] = '0d 0h 0m %ss' % revision
+
+    @staticmethod
+    def check(rnd, now, choices, **kwargs):
+        status = rnd.choice(choices)
+        last_check = now - timedelta(seconds=rnd.randint(0, 300))
+        attempt = 1 if status in ('OK', 'UP') else rnd.randint(1, 3)
+        kwargs.update({
+            'status': status,
+            'last_check': last_check.strftime('%m-%d-%Y %H:%M:%S'),
+            'duration': '%sd %sh %sm %ss' % (rnd.randint(0, 30), rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59)),
+            'attempts': '%s/3' % attempt,
+            'state_type': 'HARD' if attempt == 1 or attempt == 3 else 'SOFT',
+            'is_flapping': False,
+            'in_scheduled_downtime': rnd.random() < 0.01,
+            'active_checks_enabled': True,
+            'passive_checks_enabled': False,
+            'notifications_enabled': True,
+            'has_been_acknowledged': status not in ('OK', 'UP') and rnd.random() < 0.3,
+            'action_url': '',
+            'notes_url': '',
+            'status_information': '%s - synthetic check output %s' % (status, rnd.randint(0, 10 ** 6)),
+        })
+        return kwargs
+
+    def response(self, query):
+        """
+        The jsonoutput of status.cgi for the query string, None if the query is unknown
+        """
+        params = parse_qs(query, keep_blank_values=True)
+        style = params.get('style', [None])[0]
+        if 'hostgroup' in params:
+            name = params['hostgroup'][0]
+            if name == 'all':
+                groups = sorted(self.hostgroups.items())
+            elif name in self.hostgroups:
+                groups = [(name, self.hostgroups[name])]
+            else:
+                return None
+            if style == 'detail':
+                host_names = set(host['host_name'] for group, hosts in groups for host in hosts)
+                return {'status': {'service_status': [i for i in self.services if i['host_name'] in host_names]}}
+            return {'status': {'hostgroup_overview': [{'hostgroup_name': group, 'members': hosts}
+                                                      for group, hosts in groups]}}
+        if 'servicegroup' in params:
+            name = params['servicegroup'][0]
+            if name == 'all':
+                return {'status': {'servicegroup_overview': [{'servicegroup_name': group}
+                                                             for group in sorted(self.servicegroups)]}}
+            if name not in self.servicegroups:
+                return None
+            return {'status': {'service_status': self.servicegroups[name]}}
+        if style == 'hostdetail':
+            return {'status': {'host_status': self.hosts}}
+        return {'status': {'service_status': self.services}}
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """
+    Serves /<revision>/status.cgi?<query> from StatusData. The bodies are serialized once per
+    revision and query, so the server does not dominate the measured download times.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        try:
+            revision = int(path.strip('/').split('/')[0])
+        except ValueError:
+            self.send_error(404)
+            return
+        body = self.server.body(revision, query)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StatusServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data_kwargs):
+        HTTPServer.__init__(self, address, StatusHandler)
+        self.data_kwargs = data_kwargs
+        self.data = {}
+        self.bodies = {}
+
+    def body(self, revision, query):
+        if revision not in self.data:
+            # Only the current revision is kept
+            self.data = {revision: StatusData(revision=revision, **self.data_kwargs)}
+            self.bodies = {}
+        if query not in self.bodies:
+            response = self.data[revision].response(query)
+            self.bodies[query] = None if response is None else json.dumps(response).encode('utf-8')
+        return self.bodies[query]
+
+
+def _serve(data_kwargs, conn):
+    server = StatusServer(('127.0.0.1', 0), data_kwargs)
+    conn.send(server.server_port)
+    server.serve_forever()
+
+
+class FakeStatusCGI(object):
+    """
+    A local stand-in for status.cgi that serves StatusData. It runs in its own process, so
+    neither its CPU time nor its memory is part of the measured sync.
+
+        with FakeStatusCGI(hosts=1500, services=20000, hostgroups=200, servicegroups=10) as server:
+            settings.NAGIOS_CACHE_URL = server.url(revision=0)
+    """
+
+    def __init__(self, **data_kwargs):
+        self.data_kwargs = data_kwargs
+        self.process = None
+        self.port = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(self.data_kwargs, child_conn))
+        self.process.daemon = True
+        self.process.start()
+        self.port = parent_conn.recv()
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def warm_up(self, revision, servicegroups):
+        """
+        Request the responses of a full sync once, so the measured sync does not include their serialization
+        """
+        from nagios_cache.models import NagiosHostStatus, NagiosServiceStatus, NagiosHostgroup, NagiosServicegroup
+
+        suffixes = [NagiosHostStatus.suffix, NagiosServiceStatus.suffix, NagiosHostgroup.suffix, NagiosServicegroup.suffix]
+        suffixes += [NagiosServicegroup.suffix_single % ('servicegroup%03d' % i) for i in range(servicegroups)]
+        for suffix in suffixes:
+            requests.get('%s?%s' % (self.url(revision), suffix)).raise_for_status()
+
+    def url(self, revision=0):
+        return 'http://127.0.0.1:%s/%s/status.cgi' % (self.port, revision)
+
+
+def max_rss():
+    """
+    The peak resident memory of this process in bytes, None if it is unknown
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_benchmark(runs=3, changes=0.05, memory=False, sync_options=None, report=None, **size):
+    """
+    Sync StatusData with nagios_sync runs times against the default database. The first run is
+    the initial import, the others import a new revision with the given fraction of changed checks.
+    Every run records the peak resident memory of the process so far. With memory=True the peak
+    memory allocated by the run itself is traced with tracemalloc, which slows the sync down a lot.
+    If report is given it is called with the result of every run.
+    Returns a list with a dict per run.
+    """
+    from django.core.management import call_command
+    from django.test.utils import override_settings
+
+    from nagios_cache.stats import QueryCounter, SyncStats
+
+    data_kwargs = dict(DEFAULT_SIZE, changes=changes, now=datetime.now())
+    data_kwargs.update(size)
+    results = []
+    with FakeStatusCGI(**data_kwargs) as server:
+        for revision in range(runs):
+            server.warm_up(revision, data_kwargs['servicegroups'])
+            # Only the fake server, even if settings.NAGIOS_CACHE_SOURCES lists real Icinga servers
+            with override_settings(NAGIOS_CACHE_SOURCES=None, NAGIOS_CACHE_URL=server.url(revision),
+                                   NAGIOS_CACHE_USER=None, NAGIOS_CACHE_PASSWORD=None):
+                if memory:
+                    tracemalloc.start()
+                t = time.perf_counter()
+                with QueryCounter() as queries, SyncStats() as stats:
+                    call_command('nagios_sync', **(sync_options or {}))
+                seconds = time.perf_counter() - t
+                peak = None
+                if memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+            result = {
+                'run': revision + 1,
+                'changes': changes if revision else None,
+                'seconds': seconds,
+                'queries': queries.count,
+                'peak_memory': peak,
+                'max_rss': max_rss(),
+                'stats': stats,
+            }
+            results.append(result)
+            if report is not None:
+                report(result)
+    return results
@@ -0,0 +1,81 @@
+
+
+from itertools import islice
+
+from django.db import connections, router
+from django.db.models import CASCADE, BigIntegerField, Case, ExpressionWrapper, F, When, Value
+from django.db.models.functions import Cast
+from django.db.models.query import QuerySet
+
+
+def chunks(iterable, size):
+    """
+    Split an iterable in lists of at most size elements
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_update(model, objs, fields, batch_size=None):
+    """
+    Update the given fields of objs with as few queries as possible.
+    Newer Django versions ship QuerySet.bulk_update. For older ones we build the same
+    UPDATE ... SET field = CASE WHEN pk = ... statement ourself.
+    """
+    if not objs:
+        return
+    if hasattr(QuerySet, 'bulk_update'):
+        model._base_manager.bulk_update(objs, fields, batch_size=batch_size)
+        return
+    connection = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(name) for name in fields]
+    # Every row needs one parameter for the pk and one per field in each CASE and one in the IN clause
+    max_batch_size = connection.ops.bulk_batch_size(['pk'] * (2 * len(fields) + 1), objs)
+    batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+    for batch in chunks(objs, max(batch_size, 1)):
+        updates = {}
+        for field in fields:
+            whens = [When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field)) for obj in batch]
+            updates[field.attname] = Case(*whens, output_field=field)
+        model._base_manager.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+def add_duration(model, name, delta):
+    """
+    Expression for adding the timedelta delta to the DurationField name.
+    Backends without a native interval type store durations as microseconds, so we add those directly.
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.features.has_native_duration_field:
+        return F(name) + delta
+    microseconds = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return ExpressionWrapper(Cast(F(name), BigIntegerField()) + Value(microseconds), output_field=BigIntegerField())
+
+
+def cascade_delete(queryset):
+    """
+    Delete the rows of queryset and all rows that cascade from them with plain DELETE statements.
+    Unlike QuerySet.delete() no objects are loaded into memory: the related rows are selected with
+    subqueries on queryset. Signals are not sent. Returns the number of rows deleted from queryset.
+    """
+    model = queryset.model
+    pks = queryset.values('pk')
+    # Our own many to many relations, e.g. the members of a group
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        column = through._meta.get_field(field.m2m_field_name()).attname
+        cascade_delete(through._base_manager.filter(**{'%s__in' % column: pks}))
+    # Relations pointing to us, e.g. the services of a host or the groups of a host
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            field = relation.field
+            through = field.remote_field.through
+            column = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            cascade_delete(through._base_manager.filter(**{'%s__in' % column: pks}))
+        elif relation.on_delete is CASCADE:
+            cascade_delete(relation.related_model._base_manager.filter(**{'%s__in' % relation.field.attname: pks}))
+    return queryset._raw_delete(queryset.db)
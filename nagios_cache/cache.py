@@ -0,0 +1,53 @@
+
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'nagios_cache:generation'
+
+
+def get_cache():
+    """
+    The Django cache used for the query results, see settings.NAGIOS_CACHE_QUERY_CACHE
+    """
+    return caches[settings.NAGIOS_CACHE_QUERY_CACHE]
+
+
+def get_generation():
+    """
+    Return the current sync generation. It changes with every committed import.
+    """
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # The counter is unknown or was evicted. Start from the current time, so we never
+        # reuse a generation that may still have cached results.
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """
+    Start a new sync generation once the current transaction is committed.
+    All cached query results of the old generation are not used any more.
+    """
+    def bump():
+        cache = get_cache()
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            get_generation()
+    transaction.on_commit(bump)
+
+
+def make_key(name, *args, **kwargs):
+    """
+    Cache key for the result of the query name with the given arguments in the current generation
+    """
+    arguments = hashlib.md5(repr((args, sorted(kwargs.items()))).encode('utf-8')).hexdigest()
+    return 'nagios_cache:query:%s:%s:%s' % (get_generation(), name, arguments)
@@ -0,0 +1,89 @@
+
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from django.conf import settings
+
+from nagios_cache.sources import get_source, get_source_config
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+class NotModified(Exception):
+    """
+    The response did not change since the last import of the URL, see NagiosSyncState
+    """
+
+
+def create_session(config=None):
+    """
+    Create a requests.Session with a connection pool, retries and authentication
+    configured from the settings. config is the dict of a source, default the active one.
+    """
+    if config is None:
+        config = get_source_config()
+    session = requests.Session()
+    if config['USER'] and config['PASSWORD']:
+        # With both is given, we use it for authentication
+        session.auth = (config['USER'], config['PASSWORD'])
+    elif config['USER'] or config['PASSWORD']:
+        # Only specifing the user or password is a warning. From here we do NOT use authentication
+        log.warn('Only the user or password of the Nagios source is set. Ignore authentication')
+    retry = Retry(total=settings.NAGIOS_CACHE_RETRIES, backoff_factor=settings.NAGIOS_CACHE_RETRY_BACKOFF,
+                  status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_maxsize=settings.NAGIOS_CACHE_POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+
+def get_session():
+    """
+    Return the session of the active source that is shared by all importers of this process.
+    Keeping it alive means we do not open a new TCP/TLS connection for every download.
+    """
+    source = get_source()
+    with _session_lock:
+        if source not in _sessions:
+            _sessions[source] = create_session(get_source_config())
+        return _sessions[source]
+
+
+def close_session():
+    """
+    Close the shared sessions. The next call of get_session() will create a new one.
+    """
+    with _session_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def streaming_enabled():
+    """
+    True if the JSON responses should be parsed incrementally. This needs the optional ijson package.
+    """
+    return bool(settings.NAGIOS_CACHE_STREAMING) and ijson is not None
+
+
+def iter_json_items(response, path):
+    """
+    Yield the items of the JSON list at path (e.g. ['status', 'service_status']) while the
+    response body is downloaded. The response must be requested with stream=True.
+    """
+    # Let urllib3 decompress gzip encoded responses for us
+    response.raw.decode_content = True
+    return ijson.items(response.raw, '.'.join(list(path) + ['item']))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from nagios_cache.benchmark import DEFAULT_SIZE, run_benchmark
+
+
+class Command(BaseCommand):
+    help = """
+    Measure nagios_sync against a local fake status.cgi with synthetic data. The sync runs in a
+    test database of the default database, so run it with the settings of the backend you want to
+    measure, e.g. SQLite and PostgreSQL. Your data is not touched.
+    """
+
+    def add_arguments(self, parser):
+        for name, value in sorted(DEFAULT_SIZE.items()):
+            parser.add_argument('--%s' % name, type=int, default=value,
+                                help='Number of %s (default %s)' % (name, value))
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Number of syncs. The first one imports into the empty database (default 3)')
+        parser.add_argument('--changes', type=float, default=0.05,
+                            help='Fraction of the checks that changed between two runs (default 0.05)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+        parser.add_argument('--incremental', action='store_true', help='Use nagios_sync --incremental')
+        parser.add_argument('--memory', action='store_true',
+                            help='Trace the peak memory of every run with tracemalloc. Tracing slows the sync down')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    @staticmethod
+    def megabytes(value):
+        return '-' if value is None else '%.1f' % (value / 1024.0 / 1024.0)
+
+    def report(self, result):
+        self.stdout.write('%-4s %8s %10.3f %8s %10s %10s' % (
+            result['run'], result['changes'] or 'initial', result['seconds'], result['queries'],
+            self.megabytes(result['peak_memory']), self.megabytes(result['max_rss'])))
+        if self.verbosity > 1:
+            self.stdout.write(result['stats'].summary())
+            self.stdout.write('')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        size = dict((name, options[name]) for name in DEFAULT_SIZE)
+        self.stdout.write('%s: %s hosts, %s services, %s hostgroups, %s servicegroups' % (
+            connection.vendor, size['hosts'], size['services'], size['hostgroups'], size['servicegroups']))
+        self.stdout.write('%-4s %8s %10s %8s %10s %10s' % ('run', 'changes', 'seconds', 'queries', 'peak MB', 'RSS MB'))
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmark(runs=options['runs'], changes=options['changes'], seed=options['seed'],
+                                    memory=options['memory'], report=self.report,
+                                    sync_options={'incremental': options['incremental'], 'verbosity': 0},
+                                    **size)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if options['output']:
+            for result in results:
+                result['stats'] = result['stats'].as_dict()
+            with open(options['output'], 'w') as f:
+                json.dump({'vendor': connection.vendor, 'size': size, 'incremental': options['incremental'],
+                           'runs': results}, f, indent=2, sort_keys=True)
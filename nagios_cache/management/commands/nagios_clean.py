@@ -6,9 +6,9 @@
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from django.db import transaction
 
 from nagios_cache.models import NagiosServiceStatus, NagiosHostStatus, NagiosHostgroup, NagiosServicegroup
+from nagios_cache.models import NagiosStateTransition
 from nagios_cache.apps import DEFAULT_CONFIG
 
 
@@ -23,15 +23,30 @@ class Command(BaseCommand):
 
     NAGIOS_CACHE_CLEANCOMMAND_DAYS = %s %s
     NAGIOS_CACHE_CLEANCOMMAND_HOURS = %s %s
+    NAGIOS_CACHE_CLEAN_BATCH_SIZE = %s
+    NAGIOS_CACHE_HISTORY_DAYS = %s
 
-    """ % (settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS, TD_DAYS_DEFAULT, settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS, TD_HOURS_DEFAULT)
+    """ % (settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS, TD_DAYS_DEFAULT, settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS, TD_HOURS_DEFAULT,
+           settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE, settings.NAGIOS_CACHE_HISTORY_DAYS)
 
     def __init__(self, *args, **kwargs):
         super(Command, self).__init__(*args, **kwargs)
 
-    @transaction.atomic
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Delete in chunks of this many rows (default settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE, '
+                                 '0 deletes everything in one query)')
+
     def handle(self, *args, **options):
-        NagiosHostStatus.clean_old(days=settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS, hours=settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS)
-        NagiosHostgroup.clean_old(days=settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS, hours=settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS)
-        NagiosServiceStatus.clean_old(days=settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS, hours=settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS)
-        NagiosServicegroup.clean_old(days=settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS, hours=settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS)
+        """
+        Every batch is deleted in its own transaction, so the tables are never locked for the complete cleanup.
+        """
+        for model in [NagiosHostStatus, NagiosHostgroup, NagiosServiceStatus, NagiosServicegroup]:
+            def report(batch, count):
+                self.stdout.write('%s: removed %s rows in batch %s' % (model.__name__, count, batch))
+            total = model.clean_old(days=settings.NAGIOS_CACHE_CLEANCOMMAND_DAYS, hours=settings.NAGIOS_CACHE_CLEANCOMMAND_HOURS,
+                                    batch_size=options['batch_size'], report=report)
+            self.stdout.write('%s: removed %s rows' % (model.__name__, total))
+        total = NagiosStateTransition.prune(settings.NAGIOS_CACHE_HISTORY_DAYS, batch_size=options['batch_size'])
+        self.stdout.write('NagiosStateTransition: removed %s transitions older than %s days' % (
+            total, settings.NAGIOS_CACHE_HISTORY_DAYS))
@@ -4,11 +4,51 @@
 
 
 
-from django.core.management.base import BaseCommand
+import logging
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection, connections, transaction
+
+from nagios_cache.client import close_session
+from nagios_cache.models import NagiosServiceStatus, NagiosHostStatus, NagiosHostgroup, NagiosServicegroup, NagiosStatusSummary
+from nagios_cache.shadow import shadow_sync
+from nagios_cache.sources import activate, get_sources
+from nagios_cache.stats import SyncStats
+
+log = logging.getLogger(__name__)
+
+# The options that are passed to the sync of every source
+SYNC_OPTIONS = ['hostgroups', 'hostgroup_services', 'servicegroups', 'sync_hosts', 'sync_services',
+                'sync_hostgroups', 'sync_servicegroups', 'incremental']
+
+
+def setup_worker():
+    # The worker processes must not share the database connections and HTTP sessions of the parent
+    if not apps.ready:
+        django.setup()
+    close_session()
 
-from nagios_cache.models import NagiosServiceStatus, NagiosHostStatus, NagiosHostgroup, NagiosServicegroup
+
+def sync_source(source, options, collect_stats):
+    """
+    Sync a single source in its own transaction. This runs in the worker processes of nagios_sync.
+    Returns the SyncStats of the sync, they are empty without collect_stats.
+    """
+    stats = SyncStats()
+    with activate(source):
+        if not collect_stats:
+            Command().sync(options)
+            return stats
+        with stats:
+            Command().sync(options)
+    return stats
 
 
 class Command(BaseCommand):
@@ -29,9 +69,76 @@ class Command(BaseCommand):
         parser.add_argument('--sync-services', action='store_true', help='Sync services')
         parser.add_argument('--sync-hostgroups', action='store_true', help='Sync hostgroups')
         parser.add_argument('--sync-servicegroups', action='store_true', help='Sync servicegroups')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only apply hosts and services with a new last_check or status since the last sync. '
+                                 'Other changes are applied by the next full sync')
+        parser.add_argument('--source', action='append',
+                            help='Only sync this source of settings.NAGIOS_CACHE_SOURCES. Can be given several times')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Number of sources that are synced in parallel (default: all sources, 1 with SQLite)')
+        parser.add_argument('--strategy', choices=['transaction', 'shadow'], default=settings.NAGIOS_CACHE_SYNC_STRATEGY,
+                            help='transaction: update the tables in one transaction per source. shadow: load '
+                                 'everything into new tables and replace the old ones at the end (default %s)'
+                                 % settings.NAGIOS_CACHE_SYNC_STRATEGY)
+        parser.add_argument('--stats', action='store_true',
+                            help='Print the time, queries and rows of every import phase')
+        parser.add_argument('--stats-file', default=settings.NAGIOS_CACHE_STATS_FILE,
+                            help='Write the numbers of --stats to this file, in the Prometheus text format '
+                                 'if it ends with .prom, else as JSON')
 
-    @transaction.atomic
     def handle(self, *args, **options):
+        """
+        Every source is synced in its own transaction. With several sources they are synced in parallel
+        worker processes, so the sync takes as long as the slowest source.
+        With the shadow strategy all sources are loaded into shadow tables one after the other and
+        published together, see nagios_cache.shadow.
+        """
+        sources = options['source'] or list(get_sources())
+        unknown = set(sources) - set(get_sources())
+        if unknown:
+            raise CommandError('Unknown sources: %s' % ', '.join(sorted(unknown)))
+        processes = options['processes']
+        if processes is None:
+            # SQLite allows only one writer at a time, parallel transactions would just wait for each other
+            processes = 1 if connection.vendor == 'sqlite' else len(sources)
+        collect_stats = bool(options['stats'] or options['stats_file'])
+        sync_options = dict((name, options[name]) for name in SYNC_OPTIONS)
+        stats = SyncStats()
+        t = time.perf_counter()
+        if options['strategy'] == 'shadow':
+            if options['source'] or any(options[name] for name in SYNC_OPTIONS):
+                raise CommandError('The shadow strategy replaces all data, it only supports a full sync of all sources')
+
+            def load():
+                for source in sources:
+                    stats.merge(sync_source(source, sync_options, collect_stats))
+            shadow_sync(load)
+        elif processes <= 1 or len(sources) == 1:
+            for source in sources:
+                stats.merge(sync_source(source, sync_options, collect_stats))
+        else:
+            # The workers open their own connections
+            connections.close_all()
+            failed = []
+            with ProcessPoolExecutor(max_workers=min(processes, len(sources)), initializer=setup_worker) as executor:
+                futures = dict((executor.submit(sync_source, source, sync_options, collect_stats), source)
+                               for source in sources)
+                for future in as_completed(futures):
+                    try:
+                        stats.merge(future.result())
+                    except Exception:
+                        log.exception('Sync of source %s failed' % futures[future])
+                        failed.append(futures[future])
+            if failed:
+                raise CommandError('Sync of %s failed' % ', '.join(sorted(failed)))
+        stats.duration = time.perf_counter() - t
+        if options['stats']:
+            self.stdout.write(stats.summary())
+        if options['stats_file']:
+            stats.write(options['stats_file'])
+
+    @transaction.atomic
+    def sync(self, options):
         """
         When talking about ordering of the import you should ALWAYS:
 
@@ -42,14 +149,13 @@ class Command(BaseCommand):
         # We have to save the current time for later cleanup
         current_time = timezone.now()
         if options['sync_hosts']:
-            NagiosHostStatus.import_all(current_time)
+            NagiosHostStatus.import_all(current_time, incremental=options['incremental'])
         if options['sync_hostgroups']:
             NagiosHostgroup.import_all(current_time)
         if options['hostgroup_services']:
-            for i in options['hostgroup_services']:
-                NagiosHostgroup.import_single(current_time, i, import_services=True)
+            NagiosHostgroup.import_services(current_time, options['hostgroup_services'])
         if options['sync_services']:
-            NagiosServiceStatus.import_all(current_time)
+            NagiosServiceStatus.import_all(current_time, incremental=options['incremental'])
         if options['sync_servicegroups']:
             NagiosServicegroup.import_all(current_time)
         # Check if there is a hostgroup given
@@ -69,7 +175,9 @@ class Command(BaseCommand):
             and not options['servicegroups']
             and not options['hostgroup_services']
             ):
-            NagiosHostStatus.import_all(current_time)
+            NagiosHostStatus.import_all(current_time, incremental=options['incremental'])
             NagiosHostgroup.import_all(current_time)
-            NagiosServiceStatus.import_all(current_time)
+            NagiosServiceStatus.import_all(current_time, incremental=options['incremental'])
             NagiosServicegroup.import_all(current_time)
+        # The summaries are part of the same transaction, so they always match the synced data
+        NagiosStatusSummary.rebuild(current_time)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+
+
+import logging
+import random
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from nagios_cache.client import close_session
+from nagios_cache.models import NagiosServiceStatus, NagiosHostStatus, NagiosHostgroup, NagiosServicegroup, NagiosStatusSummary
+from nagios_cache.sources import activate, get_sources
+from nagios_cache.stats import SyncStats
+
+log = logging.getLogger(__name__)
+
+
+def close_broken_connections():
+    """
+    Close the database connections that do not work anymore, the next query opens a new one.
+    Unlike close_old_connections() this keeps a working connection open between the syncs, also with
+    the default CONN_MAX_AGE = 0.
+    """
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = """
+    Keep syncing Nagios with the database until the process receives SIGTERM or SIGINT.
+    Hosts, services, hostgroups and servicegroups of every source are synced in their own intervals, see
+    settings.NAGIOS_CACHE_SYNCD_INTERVALS. Currently they are: %s
+    """ % ', '.join('%s every %ss' % (k, v) for k, v in sorted(settings.NAGIOS_CACHE_SYNCD_INTERVALS.items()))
+
+    # The order is the import order of nagios_sync, if several syncs are due at the same time
+    ENTITIES = [
+        ('hosts', NagiosHostStatus),
+        ('hostgroups', NagiosHostgroup),
+        ('services', NagiosServiceStatus),
+        ('servicegroups', NagiosServicegroup),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super(Command, self).__init__(*args, **kwargs)
+        self.stopping = threading.Event()
+        # The SyncStats of the last successful sync per entity and source
+        self.stats = {}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Use the incremental mode of nagios_sync for hosts and services')
+
+    def stop(self, signum, frame):
+        log.info('Received signal %s. Stopping after the current sync' % signum)
+        self.stopping.set()
+
+    def next_run(self, name):
+        """
+        The time of the next sync. The interval is shifted by up to settings.NAGIOS_CACHE_SYNCD_JITTER
+        (a fraction of the interval), so the syncs do not all hit the Icinga server at the same time.
+        """
+        interval = settings.NAGIOS_CACHE_SYNCD_INTERVALS[name]
+        jitter = interval * settings.NAGIOS_CACHE_SYNCD_JITTER
+        return time.monotonic() + interval + random.uniform(-jitter, jitter)
+
+    def sync(self, name, model, options):
+        close_broken_connections()
+        for source in get_sources():
+            with activate(source):
+                self.sync_source(name, model, source, options)
+
+    def sync_source(self, name, model, source, options):
+        """
+        Sync one entity of a source in its own transaction
+        """
+        current_time = timezone.now()
+        t = time.monotonic()
+        stats = SyncStats()
+        if settings.NAGIOS_CACHE_STATS_FILE:
+            stats.connect()
+        try:
+            with transaction.atomic():
+                if name in ('hosts', 'services'):
+                    model.import_all(current_time, incremental=options['incremental'])
+                else:
+                    model.import_all(current_time)
+                NagiosStatusSummary.rebuild(current_time)
+        except Exception:
+            # A failed sync must not stop the daemon. The next interval will try again.
+            log.exception('Sync of %s from %s failed' % (name, source))
+        else:
+            log.info('Synced %s from %s in %.1f seconds' % (name, source, time.monotonic() - t))
+            if settings.NAGIOS_CACHE_STATS_FILE:
+                stats.disconnect()
+                self.stats[(name, source)] = stats
+                self.write_stats()
+                return
+        if settings.NAGIOS_CACHE_STATS_FILE:
+            stats.disconnect()
+
+    def write_stats(self):
+        """
+        Write the numbers of the last sync of every entity and source to settings.NAGIOS_CACHE_STATS_FILE
+        """
+        merged = SyncStats()
+        for stats in self.stats.values():
+            merged.merge(stats)
+        try:
+            merged.write(settings.NAGIOS_CACHE_STATS_FILE)
+        except (IOError, OSError):
+            log.exception('Could not write %s' % settings.NAGIOS_CACHE_STATS_FILE)
+
+    def handle(self, *args, **options):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # Everything is due at the start
+        next_runs = dict((name, 0) for name, model in self.ENTITIES)
+        try:
+            while not self.stopping.is_set():
+                for name, model in self.ENTITIES:
+                    if self.stopping.is_set():
+                        break
+                    if next_runs[name] <= time.monotonic():
+                        self.sync(name, model, options)
+                        next_runs[name] = self.next_run(name)
+                self.stopping.wait(max(0, min(next_runs.values()) - time.monotonic()))
+        finally:
+            close_session()
+            close_old_connections()
+        log.info('Stopped')
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0002_add_constants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nagioshostgroup',
+            name='last_database_update',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='nagioshoststatus',
+            name='last_database_update',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='nagiosservicegroup',
+            name='last_database_update',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='nagiosservicestatus',
+            name='last_database_update',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0003_last_database_update_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nagioshoststatus',
+            name='sync_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='nagiosservicestatus',
+            name='sync_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NagiosSyncState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('last_sync', models.DateTimeField(null=True)),
+                ('last_check', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0006_sync_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NagiosStatusSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.SmallIntegerField(choices=[[1, 'host'], [2, 'hostgroup'], [3, 'servicegroup']])),
+                ('object_id', models.IntegerField()),
+                ('name', models.CharField(max_length=200)),
+                ('last_database_update', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('total', models.IntegerField(default=0)),
+                ('ok', models.IntegerField(default=0)),
+                ('warning', models.IntegerField(default=0)),
+                ('critical', models.IntegerField(default=0)),
+                ('unknown', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('hard', models.IntegerField(default=0)),
+                ('soft', models.IntegerField(default=0)),
+                ('acknowledged', models.IntegerField(default=0)),
+                ('in_scheduled_downtime', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'nagios status summaries',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='nagiosstatussummary',
+            unique_together=set([('kind', 'object_id')]),
+        ),
+    ]
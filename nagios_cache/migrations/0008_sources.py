@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0007_status_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nagioshostgroup',
+            name='source',
+            field=models.CharField(default='default', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='nagioshoststatus',
+            name='source',
+            field=models.CharField(default='default', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='nagiosservicegroup',
+            name='source',
+            field=models.CharField(default='default', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='nagiosservicestatus',
+            name='source',
+            field=models.CharField(default='default', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='nagiosstatussummary',
+            name='source',
+            field=models.CharField(db_index=True, default='default', editable=False, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='nagioshostgroup',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='nagiosservicegroup',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nagioshostgroup',
+            unique_together=set([('source', 'name')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nagioshoststatus',
+            unique_together=set([('source', 'host_name')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nagiosservicegroup',
+            unique_together=set([('source', 'name')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nagiosservicestatus',
+            unique_together=set([('source', 'host', 'host_name', 'service_description')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='nagiosservicestatus',
+            index_together=set([('source', 'host_name', 'service_description')]),
+        ),
+    ]
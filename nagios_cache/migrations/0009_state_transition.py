@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0008_sources'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NagiosStateTransition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.DateTimeField()),
+                ('status', models.SmallIntegerField(choices=[[1, 'OK'], [2, 'UP'], [3, 'DOWN'], [4, 'WARNING'], [5, 'CRITICAL'], [6, 'UNKNOWN'], [7, 'PENDING'], [8, 'UNREACHABLE']])),
+                ('state_type', models.SmallIntegerField(choices=[[1, 'HARD'], [2, 'SOFT']])),
+                ('previous_status', models.SmallIntegerField(choices=[[1, 'OK'], [2, 'UP'], [3, 'DOWN'], [4, 'WARNING'], [5, 'CRITICAL'], [6, 'UNKNOWN'], [7, 'PENDING'], [8, 'UNREACHABLE']], null=True)),
+                ('host', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transitions', to='nagios_cache.NagiosHostStatus')),
+                ('service', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='transitions', to='nagios_cache.NagiosServiceStatus')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='nagiosstatetransition',
+            index_together=set([('service', 'time'), ('host', 'time')]),
+        ),
+    ]
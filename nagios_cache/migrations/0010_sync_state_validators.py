@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:24
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0009_state_transition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nagiossyncstate',
+            name='body_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='nagiossyncstate',
+            name='etag',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='nagiossyncstate',
+            name='last_modified',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
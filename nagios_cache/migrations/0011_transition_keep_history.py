@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nagios_cache', '0010_sync_state_validators'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nagiosstatetransition',
+            name='host',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='transitions', to='nagios_cache.NagiosHostStatus'),
+        ),
+        migrations.AlterField(
+            model_name='nagiosstatetransition',
+            name='service',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='transitions', to='nagios_cache.NagiosServiceStatus'),
+        ),
+    ]
@@ -1,15 +1,27 @@
 
 
-import parsedatetime
-import pytz
+import hashlib
+import json
 import logging
-import requests
+import time
 
-from datetime import datetime, timedelta
-from django.db import models
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import chain
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, IntegerField, Sum, When
+from django.db.models.base import ModelState
 from django.utils import timezone
 from django.conf import settings
 
+from nagios_cache.bulk import add_duration, bulk_update, cascade_delete, chunks
+from nagios_cache.cache import bump_generation
+from nagios_cache.client import NotModified, get_session, iter_json_items, streaming_enabled
+from nagios_cache.parsers import parse_datetime, parse_duration
+from nagios_cache.sources import DEFAULT_SOURCE, get_source, get_source_config
+from nagios_cache.stats import phase, record_count, record_phase
+
 log = logging.getLogger(__name__)
 
 
@@ -20,15 +32,76 @@ class NagiosImportable(models.Model):
     """
     # We use this custom field to store the last sync. It can not be 'auto_now' because we want
     # to delete items bases on this value.
-    # TODO: Maybe the timestamp is the same in the complete transaction?
-    last_database_update = models.DateTimeField(auto_now_add=True)
+    # The importers set it to the start time of the sync, so it is the same in the complete transaction.
+    # It is indexed because clean_old() filters on it.
+    last_database_update = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+    # The name of the Icinga server the entry was imported from, see nagios_cache.sources.
+    # It is the first field of the unique keys of the importers, so it needs no index of its own.
+    source = models.CharField(max_length=50, default=DEFAULT_SOURCE, editable=False)
+
+    @classmethod
+    def source_objects(cls):
+        """
+        The entries of the active source. The importers only look at these.
+        """
+        return cls.objects.filter(source=get_source())
 
     @classmethod
-    def clean_old(cls, days=0, hours=0):
+    def clean_old(cls, days=0, hours=0, batch_size=None, report=None):
+        """
+        Remove all entries that were not synced in the given days and hours.
+        The entries are deleted in chunks of batch_size primary keys (default
+        settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE, 0 deletes everything at once). Every chunk are the oldest
+        entries, found with the index on last_database_update, deleted with raw DELETE statements in its
+        own transaction, including the rows of the many to many tables and the services of a host. So neither the memory nor the time a
+        table is locked grows with the number of removed entries.
+        If report is given it is called with the batch number and the rows removed in that batch.
+        Returns the number of removed entries.
+        """
         query = cls.objects.filter(last_database_update__lt=timezone.now()-timedelta(days=days)-timedelta(hours=hours))
-        log.debug('Removing %s old entries for %s that are older than %s days and %s hours' % (query.count(), cls.__name__, days, hours))
-        query.delete()
+        if batch_size is None:
+            batch_size = settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE
+        if not batch_size:
+            count = query.count()
+            log.debug('Removing %s old entries for %s that are older than %s days and %s hours' % (count, cls.__name__, days, hours))
+            query.delete()
+            if count:
+                cls.forget_responses()
+                bump_generation()
+            return count
+        total = 0
+        batch = 0
+        while True:
+            # Ordered by the indexed column, ordering by pk alone lets the database scan the table
+            pks = list(query.order_by('last_database_update', 'pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            batch += 1
+            with transaction.atomic():
+                cascade_delete(query.filter(pk__in=pks))
+            total += len(pks)
+            log.debug('Removed %s old entries for %s in batch %s' % (len(pks), cls.__name__, batch))
+            if report is not None:
+                report(batch, len(pks))
+        log.debug('Removed %s old entries for %s that are older than %s days and %s hours' % (total, cls.__name__, days, hours))
+        if total:
+            cls.forget_responses()
+            bump_generation()
+        return total
 
+    @classmethod
+    def forget_responses(cls):
+        """
+        Forget the last responses of the imports of the model and of the models whose rows are deleted
+        with its rows, e.g. the services and the hostgroups of a host. The next import of an unchanged
+        response has to create the removed rows again.
+        """
+        affected = [cls]
+        for model in affected:
+            for relation in model._meta.related_objects:
+                if issubclass(relation.related_model, NagiosImportable) and relation.related_model not in affected:
+                    affected.append(relation.related_model)
+        NagiosSyncState.forget_models(affected)
 
     @classmethod
     def run_autoclean(cls):
@@ -39,52 +112,194 @@ class NagiosImportable(models.Model):
     def get_nagios_url(suffix):
         """
         This will return the URL that is used to download the json file from Icinga/Nagios
+        of the active source
+        """
+        return '%s?%s' % (get_source_config()['URL'], suffix)
+
+    @classmethod
+    def sync_state_name(cls, suffix):
+        """
+        The name of the NagiosSyncState of the imports of suffix from the active source
         """
-        return '%s?%s' % (settings.NAGIOS_CACHE_URL, suffix)
+        name = '%s:%s?%s' % (get_source(), cls.__name__, suffix)
+        if len(name) > 200:
+            # Very long group names
+            name = '%s:%s' % (name[:150], hashlib.sha1(name.encode('utf-8')).hexdigest())
+        return name
 
     @classmethod
-    def get_json_from_url(cls, suffix):
+    def get_json_from_url(cls, suffix, state=None):
         """
-        This method will download the JSON data from Icinga/Nagios
+        This method will download the JSON data from Icinga/Nagios.
+        All importers share one pooled session, see nagios_cache.client.
+        With a NagiosSyncState the request is conditional and NotModified is raised if the response
+        did not change since its last import. The state then knows the new response, the caller saves it
+        after the import.
         """
-        auth = ()
         used_url = cls.get_nagios_url(suffix)
-        if hasattr(settings, 'NAGIOS_CACHE_USER') and hasattr(settings, 'NAGIOS_CACHE_PASSWORD'):
-            # With both is given, we use it for authentication
-            auth = (settings.NAGIOS_CACHE_USER, settings.NAGIOS_CACHE_PASSWORD)
-        elif hasattr(settings, 'NAGIOS_CACHE_USER') or hasattr(settings, 'NAGIOS_CACHE_PASSWORD'):
-            # Only specifing the user or password is a warning. From here we do NOT use authentication
-            log.warn('Only NAGIOS_CACHE_USER or NAGIOS_CACHE_PASSWORD is set. Ignore authentication')
-        else:
-            auth = ()
         log.debug('Fetching data from %s' % used_url)
         t = timezone.now()
-        r = requests.get(used_url, auth=auth)
+        with phase(cls, 'download', count_queries=False):
+            r = get_session().get(used_url, timeout=settings.NAGIOS_CACHE_TIMEOUT,
+                                  headers=state.request_headers() if state is not None else None)
+            if r.status_code == 304:
+                record_count(cls, 'responses_not_modified', 1)
+                raise NotModified(used_url)
+            r.raise_for_status()
         log.debug('Download took %s seconds' % (timezone.now()-t))
-        return r.json()
-
-    @classmethod
-    def nagios2object(cls, nagios_dict, current_time):
-        # Map the dict to the class attributes
-        obj = cls(**nagios_dict)
-        # Fix fields that does not match the datatype
-        obj.attempts, obj.attempts_of = list(map(int, obj.attempts.split('/')))
-        # parse the duration field and assign it to the duration field.
-        # Unfortunatly the nagios syntax is kinda strange...
-        cal = parsedatetime.Calendar()
-        # We need to do this to make the nagios time timezone aware
-        future_time, _ = cal.parse(obj.duration)
-        future_time = pytz.utc.localize(timezone.datetime(*future_time[:6]))
-        obj.duration = future_time - current_time
-        last_check, _ = cal.parse(obj.last_check)
-        obj.last_check = pytz.utc.localize(timezone.datetime(*last_check[:6]))
-        # Map the states
-        obj.state_type = NagiosServiceStatus.state_type_from_nagios(obj.state_type)
-        obj.status = NagiosServiceStatus.status_from_nagios(obj.status)
-        # Set the last update time
-        obj.last_database_update = current_time
+        record_count(cls, 'bytes_downloaded', len(r.content))
+        if state is not None:
+            body_hash = hashlib.sha1(r.content).hexdigest()
+            if state.is_unchanged(body_hash):
+                record_count(cls, 'responses_not_modified', 1)
+                raise NotModified(used_url)
+            state.set_response(r, body_hash)
+        with phase(cls, 'parse', count_queries=False):
+            return r.json()
+
+    @classmethod
+    def iter_json_from_url(cls, suffix, *path, **kwargs):
+        """
+        Return an iterator over the entries of the JSON list at path, e.g. iter_json_from_url(suffix, 'status', 'host_status').
+        With settings.NAGIOS_CACHE_STREAMING the response is parsed while it is downloaded,
+        so the complete document never has to be in memory.
+        The request is sent right away, so a state=NagiosSyncState raises NotModified here, see get_json_from_url().
+        A streamed response is only compared by its ETag and Last-Modified headers.
+        """
+        state = kwargs.pop('state', None)
+        if not streaming_enabled():
+            items = cls.get_json_from_url(suffix, state=state)
+            for key in path:
+                items = items[key]
+            return iter(items)
+        used_url = cls.get_nagios_url(suffix)
+        log.debug('Streaming data from %s' % used_url)
+        t = time.perf_counter()
+        r = get_session().get(used_url, timeout=settings.NAGIOS_CACHE_TIMEOUT, stream=True,
+                              headers=state.request_headers() if state is not None else None)
+        try:
+            if r.status_code == 304:
+                record_count(cls, 'responses_not_modified', 1)
+                raise NotModified(used_url)
+            r.raise_for_status()
+        except Exception:
+            r.close()
+            raise
+        if state is not None:
+            state.set_response(r, '')
+        return cls._iter_stream(r, path, time.perf_counter() - t)
+
+    @classmethod
+    def _iter_stream(cls, r, path, seconds):
+        # Downloading and parsing happen together, we measure the time spent in here as download
+        t = time.perf_counter()
+        try:
+            for item in iter_json_items(r, path):
+                seconds += time.perf_counter() - t
+                yield item
+                t = time.perf_counter()
+            seconds += time.perf_counter() - t
+            record_count(cls, 'bytes_downloaded', r.raw.tell())
+        finally:
+            r.close()
+        record_phase(cls, 'download', seconds)
+
+    @classmethod
+    def get_json_from_urls(cls, suffixes, states=None):
+        """
+        Download several JSON files with up to settings.NAGIOS_CACHE_FETCH_CONCURRENCY parallel requests.
+        The results are returned in the order of the suffixes. Only the downloads run in the worker
+        threads, so the caller can write the results to the database in its own transaction.
+        With a list of NagiosSyncState per suffix the result of an unchanged response is None.
+        """
+        if states is None:
+            states = [None] * len(suffixes)
+
+        def download(suffix, state):
+            try:
+                return cls.get_json_from_url(suffix, state=state)
+            except NotModified:
+                return None
+        workers = min(settings.NAGIOS_CACHE_FETCH_CONCURRENCY, len(suffixes))
+        if workers <= 1:
+            return [download(suffix, state) for suffix, state in zip(suffixes, states)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(download, suffixes, states))
+
+    # Fields whose Nagios value does not match the datatype: attname -> (Nagios key, converter).
+    # A converter is called with the Nagios value and the current time.
+    CONVERTERS = {}
+
+    @classmethod
+    def conversion_plan(cls):
+        """
+        Return a list of (attname, Nagios key, converter) for every concrete field, computed once per model.
+        Fields that are not in the Nagios data have no key, they get their value from import_defaults().
+        """
+        plan = cls.__dict__.get('_conversion_plan')
+        if plan is None:
+            plan = []
+            for field in cls._meta.concrete_fields:
+                key, converter = cls.CONVERTERS.get(field.attname, (field.attname, None))
+                if field.primary_key or field.is_relation or field.attname in ('last_database_update', 'source', 'sync_hash'):
+                    key = None
+                plan.append((field.attname, key, converter))
+            cls._conversion_plan = plan
+            cls._conversion_attnames = [attname for attname, key, converter in plan]
+        return plan
+
+    @classmethod
+    def import_defaults(cls, current_time):
+        """
+        The values of the fields that are not in the Nagios data
+        """
+        return {'last_database_update': current_time, 'source': get_source(), 'sync_hash': ''}
+
+    @classmethod
+    def nagios2values(cls, nagios_dict, current_time, defaults=None):
+        """
+        Convert a Nagios dict to a tuple of column values in the order of conversion_plan()
+        """
+        if defaults is None:
+            defaults = cls.import_defaults(current_time)
+        values = []
+        for attname, key, converter in cls.conversion_plan():
+            if key is None:
+                values.append(defaults.get(attname))
+            elif converter is None:
+                values.append(nagios_dict[key])
+            else:
+                values.append(converter(nagios_dict[key], current_time))
+        return tuple(values)
+
+    @classmethod
+    def values2object(cls, values):
+        """
+        Create an unsaved object from the values of nagios2values(). It is meant for the bulk writers,
+        so it does not run Model.__init__ and does not send the pre_init and post_init signals.
+        """
+        cls.conversion_plan()
+        obj = cls.__new__(cls)
+        obj._state = ModelState()
+        obj.__dict__.update(zip(cls._conversion_attnames, values))
         return obj
 
+    @classmethod
+    def nagios2object(cls, nagios_dict, current_time, defaults=None):
+        return cls.values2object(cls.nagios2values(nagios_dict, current_time, defaults))
+
+    @classmethod
+    def bulk_save(cls, objs):
+        """
+        Write the objects in batches of settings.NAGIOS_CACHE_BATCH_SIZE. Objects that are already in the
+        table (obj._state.adding is False) are updated, all others are created, with their primary key if
+        they have one.
+        """
+        batch_size = settings.NAGIOS_CACHE_BATCH_SIZE
+        fields = [f.name for f in cls._meta.concrete_fields if not f.primary_key]
+        cls.objects.bulk_create([obj for obj in objs if obj._state.adding], batch_size=batch_size)
+        bulk_update(cls, [obj for obj in objs if not obj._state.adding], fields, batch_size=batch_size)
+
     class Meta:
         abstract = True
 
@@ -123,6 +338,20 @@ class NagiosStatus(NagiosImportable):
         [STATUS_UNREACHABLE, 'UNREACHABLE'],
     ]
 
+    # Lookup tables Nagios name -> code
+    STATE_TYPE_CODES = dict((name, code) for code, name in STATE_TYPE)
+    STATUS_CODES = dict((name, code) for code, name in STATUS)
+
+    CONVERTERS = {
+        'attempts': ('attempts', lambda value, current_time: int(value.split('/')[0])),
+        'attempts_of': ('attempts', lambda value, current_time: int(value.split('/')[1])),
+        # Unfortunatly the nagios syntax of the duration is kinda strange...
+        'duration': ('duration', parse_duration),
+        'last_check': ('last_check', lambda value, current_time: parse_datetime(value)),
+        'state_type': ('state_type', lambda value, current_time: NagiosStatus.state_type_from_nagios(value)),
+        'status': ('status', lambda value, current_time: NagiosStatus.status_from_nagios(value)),
+    }
+
     action_url = models.URLField(blank=True, null=True)
     active_checks_enabled = models.BooleanField()
     attempts = models.SmallIntegerField()
@@ -140,7 +369,11 @@ class NagiosStatus(NagiosImportable):
     state_type = models.SmallIntegerField(choices=STATE_TYPE)
     status = models.SmallIntegerField(choices=STATUS)
     status_information = models.TextField()
+    # Fingerprint of the imported Nagios data, see fingerprint()
+    sync_hash = models.CharField(max_length=40, blank=True, default='', editable=False)
 
+    # The table of the readers while nagios_cache.shadow loads the model into a shadow table, see live_rows()
+    live_db_table = None
 
     class Meta:
         abstract = True
@@ -148,43 +381,244 @@ class NagiosStatus(NagiosImportable):
     def __unicode__(self):
         return self.host_display_name
 
+    @classmethod
+    def pk_index(cls, keys=None):
+        """
+        Return a dict import_key -> pk of all rows of the active source, loaded with one query.
+        For a single field key (hosts) the key is the plain value.
+        With a list of import keys only the rows that share the first key field with one of them are loaded.
+        """
+        query = cls.source_objects()
+        if keys is not None:
+            query = query.filter(**{'%s__in' % cls.import_key[0]: set(key[0] for key in keys)})
+        values = query.values_list(*(list(cls.import_key) + ['id']))
+        if len(cls.import_key) == 1:
+            return dict(values)
+        return dict((row[:-1], row[-1]) for row in values)
+
+    @classmethod
+    def live_rows(cls):
+        """
+        While the model is loaded into a shadow table, return a dict import_key -> (pk, status, state_type)
+        of the rows of the active source in the table of the readers, loaded with one query. Otherwise an
+        empty dict.
+        """
+        if cls.live_db_table is None:
+            return {}
+        quote = connection.ops.quote_name
+        columns = [cls._meta.get_field(name).column for name in list(cls.import_key) + ['id', 'status', 'state_type']]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT %s FROM %s WHERE %s = %%s' % (', '.join(quote(column) for column in columns),
+                                                                 quote(cls.live_db_table), quote('source')),
+                           [get_source()])
+            return dict((tuple(row[:-3]), tuple(row[-3:])) for row in cursor.fetchall())
+
+    @classmethod
+    def fingerprint(cls, nagios_dict):
+        """
+        Hash of the Nagios fields of a row, used to detect if it changed since the last import.
+        The duration grows with every import, so it is not part of it.
+        """
+        values = dict(nagios_dict)
+        values.pop('duration', None)
+        return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def import_url(cls, suffix, current_time, prepare=None, incremental=False):
+        """
+        Import the hosts or services from the given URL suffix with import_rows().
+        The newest last_check of the import is stored in NagiosSyncState. With incremental=True only rows
+        with a last_check since that watermark are checked for changes, see import_rows().
+        If the response did not change since the last import, the rows of that import are only marked as synced.
+        Returns the number of written and unchanged rows.
+        """
+        state = NagiosSyncState.get_state(cls.sync_state_name(suffix))
+        try:
+            rows = cls.iter_json_from_url(suffix, 'status', cls.json_list, state=state)
+        except NotModified:
+            unchanged = cls.touch_unchanged(state, current_time)
+            log.debug('%s did not change since the last import, marked %s rows as synced' % (suffix, unchanged))
+            state.last_sync = current_time
+            state.save()
+            return 0, unchanged
+        if incremental:
+            # The watermark skips rows, so this is no complete import of the response
+            state.forget_response()
+        if suffix != cls.suffix:
+            NagiosSyncState.forget(cls.sync_state_name(cls.suffix))
+        watermark = state.last_check if incremental else None
+        written, unchanged, newest_check, skipped = cls.import_rows(rows, current_time, prepare=prepare,
+                                                                    watermark=watermark)
+        if skipped:
+            # The skipped rows, e.g. the services of a host that is not imported yet, have to be imported
+            # with the next response even if it did not change
+            state.forget_response()
+        state.last_sync = current_time
+        if newest_check is not None and (state.last_check is None or newest_check > state.last_check):
+            state.last_check = newest_check
+        state.save()
+        return written, unchanged
+
+    @classmethod
+    def import_rows(cls, rows, current_time, prepare=None, watermark=None):
+        """
+        Import an iterable of Nagios dicts in batches of settings.NAGIOS_CACHE_BATCH_SIZE.
+        The rows are matched with the database by cls.import_key. Rows whose fingerprint did not change
+        since the last import are only marked as synced. If prepare is given, it is called with every
+        new or changed object and the object is skipped if it returns False.
+        With a watermark, rows that were last checked before it and still have the same status,
+        acknowledgement and downtime are taken as unchanged without computing their fingerprint.
+        New rows and rows whose status or state type changed are appended to NagiosStateTransition.
+        While nagios_cache.shadow loads the model, the rows are new in the shadow table, but keep the primary
+        key and are compared with the state they have in the table of the readers, see live_rows().
+        Returns the number of written and unchanged rows, the newest last_check and the number of skipped rows.
+        """
+        # Preload all existing rows in one query, so we do not have to look up every single one
+        fields = ['id', 'last_database_update', 'sync_hash', 'status', 'has_been_acknowledged', 'in_scheduled_downtime',
+                  'state_type']
+        existing = dict((row[:-len(fields)], row[-len(fields):]) for row in
+                        cls.source_objects().values_list(*(list(cls.import_key) + fields)))
+        live = cls.live_rows()
+        seen = set()
+        newest_check = None
+        written_count = unchanged_count = skipped_count = 0
+        convert_seconds = 0
+        defaults = cls.import_defaults(current_time)
+        history = NagiosStateTransition.enabled()
+        for batch in chunks(rows, settings.NAGIOS_CACHE_BATCH_SIZE):
+            objs = []
+            unchanged = []
+            # (key, obj, previous (status, state_type)) of the rows that need a transition
+            changed = []
+            t = time.perf_counter()
+            for current_status in batch:
+                key = tuple(current_status[f] for f in cls.import_key)
+                if key in seen:
+                    skipped_count += 1
+                    continue
+                seen.add(key)
+                last_check = parse_datetime(current_status['last_check'])
+                if newest_check is None or last_check > newest_check:
+                    newest_check = last_check
+                row = existing.get(key)
+                if (row is not None and watermark is not None and last_check < watermark
+                        and row[3:6] == (cls.status_from_nagios(current_status['status']),
+                                        current_status['has_been_acknowledged'], current_status['in_scheduled_downtime'])):
+                    unchanged.append(row[:2])
+                    continue
+                sync_hash = cls.fingerprint(current_status)
+                if row is not None and row[2] == sync_hash:
+                    unchanged.append(row[:2])
+                    continue
+                # Create a database object
+                obj = cls.nagios2object(current_status, current_time, defaults)
+                obj.sync_hash = sync_hash
+                if prepare is not None and not prepare(obj):
+                    skipped_count += 1
+                    continue
+                previous = None
+                if row is not None:
+                    # If the object already exists, assign the PK to the new object.
+                    obj.id = row[0]
+                    obj._state.adding = False
+                    previous = (row[3], row[6])
+                elif key in live:
+                    # A shadow load creates the entry with the PK of the table of the readers
+                    obj.id = live[key][0]
+                    previous = live[key][1:]
+                if history and (obj.status, obj.state_type) != previous:
+                    changed.append((key, obj, previous))
+                objs.append(obj)
+            convert_seconds += time.perf_counter() - t
+            record_count(cls, 'created', len([obj for obj in objs if obj._state.adding]))
+            record_count(cls, 'updated', len([obj for obj in objs if not obj._state.adding]))
+            with phase(cls, 'write'):
+                cls.bulk_save(objs)
+                cls.touch(unchanged, current_time)
+                if changed:
+                    # After the save, so the created objects have a primary key or can be looked up
+                    NagiosStateTransition.record(cls, [
+                        (key, cls.new_transition(obj, current_time, None if previous is None else previous[0]))
+                        for key, obj, previous in changed])
+            written_count += len(objs)
+            unchanged_count += len(unchanged)
+        record_phase(cls, 'convert', convert_seconds)
+        record_count(cls, 'unchanged', unchanged_count)
+        record_count(cls, 'skipped', skipped_count)
+        return written_count, unchanged_count, newest_check, skipped_count
+
+    @classmethod
+    def touch(cls, rows, current_time):
+        """
+        Mark unchanged rows as synced without rewriting them. rows is a list of (pk, last_database_update).
+        Since the state did not change, the duration just grew by the time since the last import.
+        Usually all rows come from the same import, so this is one UPDATE ... WHERE id IN (...) per batch.
+        """
+        pks_by_last_update = defaultdict(list)
+        for pk, last_database_update in rows:
+            pks_by_last_update[last_database_update].append(pk)
+        for last_database_update, pks in pks_by_last_update.items():
+            for batch in chunks(pks, settings.NAGIOS_CACHE_BATCH_SIZE):
+                duration = add_duration(cls, 'duration', current_time - last_database_update)
+                cls.objects.filter(pk__in=batch).update(last_database_update=current_time, duration=duration)
+
+    @classmethod
+    def touch_unchanged(cls, state, current_time):
+        """
+        Mark the rows of the last import of state as synced, its response did not change since.
+        Returns the number of rows.
+        """
+        rows = list(cls.source_objects().filter(last_database_update__gte=state.last_sync)
+                    .values_list('id', 'last_database_update'))
+        with phase(cls, 'write'):
+            cls.touch(rows, current_time)
+        record_count(cls, 'unchanged', len(rows))
+        return len(rows)
+
+    @classmethod
+    def new_transition(cls, obj, current_time, previous_status):
+        """
+        The NagiosStateTransition to the current state of obj. Its primary key is not known yet
+        for new objects, NagiosStateTransition.record() sets it.
+        Nagios reports the time since the last state change as duration.
+        """
+        return NagiosStateTransition(host_id=obj.pk, time=current_time - obj.duration, status=obj.status,
+                                     state_type=obj.state_type, previous_status=previous_status)
+
     @staticmethod
     def state_type_from_nagios(s):
-        for i in NagiosStatus.STATE_TYPE:
-            if i[1] == s:
-                return i[0]
-        raise Exception('Unknown NagiosStatus.state_type: %s' % s)
+        try:
+            return NagiosStatus.STATE_TYPE_CODES[s]
+        except KeyError:
+            raise Exception('Unknown NagiosStatus.state_type: %s' % s)
 
     @staticmethod
     def status_from_nagios(s):
-        for i in NagiosStatus.STATUS:
-            if i[1] == s:
-                return i[0]
-        raise Exception('Unknown NagiosStatus.status: %s' % s)
+        try:
+            return NagiosStatus.STATUS_CODES[s]
+        except KeyError:
+            raise Exception('Unknown NagiosStatus.status: %s' % s)
 
 
 class NagiosHostStatus(NagiosStatus):
 
     suffix = 'style=hostdetail&jsonoutput'
+    json_list = 'host_status'
+    import_key = ('host_name',)
+    # The field of NagiosStateTransition that references the entry
+    transition_attname = 'host_id'
 
     class Meta:
-        unique_together = [['host_name']]
+        unique_together = [['source', 'host_name']]
 
     @staticmethod
-    def import_all(current_time):
+    def import_all(current_time, incremental=False):
         NagiosHostStatus.run_autoclean()
-        items = NagiosHostStatus.get_json_from_url(NagiosHostStatus.suffix)
-        nagios_list = items['status']['host_status']
-        log.info('Importing %s NagiosHostStatus from %s' % (len(nagios_list), NagiosHostStatus.get_nagios_url(NagiosHostStatus.suffix)))
+        log.info('Importing NagiosHostStatus from %s' % NagiosHostStatus.get_nagios_url(NagiosHostStatus.suffix))
         t = timezone.now()
-        for current_status in nagios_list:
-            # Create a database object
-            obj = NagiosHostStatus.nagios2object(current_status, current_time)
-            # If the object already exists, assign the PK to the new object.
-            if NagiosHostStatus.objects.filter(host_name=obj.host_name).exists():
-                obj.id = NagiosHostStatus.objects.get(host_name=obj.host_name).id
-            obj.save()
-        log.debug('Import took %s seconds' % (timezone.now() - t))
+        written, unchanged = NagiosHostStatus.import_url(NagiosHostStatus.suffix, current_time, incremental=incremental)
+        log.debug('Import took %s seconds (%s written, %s unchanged)' % (timezone.now() - t, written, unchanged))
+        bump_generation()
 
 
 class NagiosServiceStatus(NagiosStatus):
@@ -193,111 +627,308 @@ class NagiosServiceStatus(NagiosStatus):
     host = models.ForeignKey(NagiosHostStatus)
 
     suffix = 'jsonoutput'
+    json_list = 'service_status'
+    import_key = ('host_name', 'service_description')
+    transition_attname = 'service_id'
 
     class Meta:
-        unique_together = [['host', 'host_name', 'service_description']]
+        unique_together = [['source', 'host', 'host_name', 'service_description']]
+        # The importers look up services by this key (see import_key)
+        index_together = [['source', 'host_name', 'service_description']]
 
     def __unicode__(self):
         return "%s | %s" % (self.host.host_display_name, self.service_display_name)
 
+    @classmethod
+    def new_transition(cls, obj, current_time, previous_status):
+        transition = super(NagiosServiceStatus, cls).new_transition(obj, current_time, previous_status)
+        transition.host_id = obj.host_id
+        transition.service_id = obj.pk
+        return transition
+
+    @staticmethod
+    def host_lookup():
+        """
+        Return a prepare function for import_rows() that sets the foreign key of the host
+        """
+        # Preload the primary keys of all hosts. So we do not have to query them for every service.
+        host_ids = NagiosHostStatus.pk_index()
+
+        def lookup_host(obj):
+            # Lookup the foreign key for the host
+            obj.host_id = host_ids.get(obj.host_name)
+            if obj.host_id is None:
+                log.error('Could not find host %s. Not importing service %s' % (obj.host_name, obj.service_description))
+                return False
+            return True
+        return lookup_host
+
     @staticmethod
-    def import_from_url(current_time, url):
+    def import_from_url(current_time, url, incremental=False):
         NagiosServiceStatus.run_autoclean()
-        items = NagiosServiceStatus.get_json_from_url(url)
-        nagios_list = items['status']['service_status']
-        log.info('Importing %s NagiosServiceStatus from %s' % (len(nagios_list), NagiosServiceStatus.get_nagios_url(url)))
+        log.info('Importing NagiosServiceStatus from %s' % NagiosServiceStatus.get_nagios_url(url))
         t = timezone.now()
-        for current_status in nagios_list:
-            # Create a database object
-            obj = NagiosServiceStatus.nagios2object(current_status, current_time)
-            # Lookup the foreign key for the host
-            obj.host = NagiosHostStatus.objects.get(host_name=obj.host_name)
-            if NagiosServiceStatus.objects.filter(host_name=obj.host_name, service_description=obj.service_description).exists():
-                # If the object already exists, assign the PK to the new object.
-                obj.id = NagiosServiceStatus.objects.get(host_name=obj.host_name, service_description=obj.service_description).id
-            obj.save()
-        log.debug('Import took %s seconds' % (timezone.now() - t))
+        written, unchanged = NagiosServiceStatus.import_url(url, current_time, prepare=NagiosServiceStatus.host_lookup(),
+                                                            incremental=incremental)
+        log.debug('Import took %s seconds (%s written, %s unchanged)' % (timezone.now() - t, written, unchanged))
+        bump_generation()
 
     @staticmethod
-    def import_all(current_time):
-        NagiosServiceStatus.import_from_url(current_time, NagiosServiceStatus.suffix)
+    def import_from_urls(current_time, urls, host_names=None):
+        """
+        Import the services of several URLs at once. The responses are downloaded in parallel and a
+        service that is in more than one of them is converted and written only once.
+        With host_names only the services of these hosts are imported.
+        """
+        NagiosServiceStatus.run_autoclean()
+        log.info('Importing NagiosServiceStatus from %s' % ', '.join(NagiosServiceStatus.get_nagios_url(url) for url in urls))
+        t = timezone.now()
+        if len(urls) == 1:
+            rows = NagiosServiceStatus.iter_json_from_url(urls[0], 'status', NagiosServiceStatus.json_list)
+        else:
+            rows = chain.from_iterable(result['status'][NagiosServiceStatus.json_list]
+                                       for result in NagiosServiceStatus.get_json_from_urls(urls))
+        if host_names is not None:
+            rows = (row for row in rows if row['host_name'] in host_names)
+        # The next full import has to compare the services again
+        NagiosSyncState.forget(NagiosServiceStatus.sync_state_name(NagiosServiceStatus.suffix))
+        written, unchanged, _, _ = NagiosServiceStatus.import_rows(rows, current_time,
+                                                                   prepare=NagiosServiceStatus.host_lookup())
+        log.debug('Import took %s seconds (%s written, %s unchanged)' % (timezone.now() - t, written, unchanged))
+        bump_generation()
+
+    @staticmethod
+    def import_all(current_time, incremental=False):
+        NagiosServiceStatus.import_from_url(current_time, NagiosServiceStatus.suffix, incremental)
 
 
-class NagiosHostgroup(NagiosImportable):
+class NagiosGroup(NagiosImportable):
+    """
+    This is a abstract class for Hostgroups and Servicegroups. Both are just a name and
+    a many to many relation to their members.
+    """
     name = models.CharField(max_length=200)
+
+    class Meta:
+        abstract = True
+        unique_together = [['source', 'name']]
+
+    def __unicode__(self):
+        return self.name
+
+    @classmethod
+    def get_or_create_groups(cls, names, current_time):
+        """
+        Return a dict name -> group of the active source for the given names. Groups that do not exist yet are created.
+        All of them are marked as synced at current_time.
+        """
+        groups = {}
+        for batch in chunks(set(names), settings.NAGIOS_CACHE_BATCH_SIZE):
+            groups.update((group.name, group) for group in cls.source_objects().filter(name__in=batch))
+        missing = [name for name in set(names) if name not in groups]
+        if missing:
+            cls.objects.bulk_create([cls(name=name, source=get_source(), last_database_update=current_time) for name in missing],
+                                    batch_size=settings.NAGIOS_CACHE_BATCH_SIZE)
+            # Not every database returns the primary keys of bulk_create, so we fetch them again
+            for batch in chunks(missing, settings.NAGIOS_CACHE_BATCH_SIZE):
+                groups.update((group.name, group) for group in cls.source_objects().filter(name__in=batch))
+        for batch in chunks([group.pk for group in groups.values()], settings.NAGIOS_CACHE_BATCH_SIZE):
+            cls.objects.filter(pk__in=batch).update(last_database_update=current_time)
+        for group in groups.values():
+            group.last_database_update = current_time
+        return groups
+
+    @classmethod
+    def sync_members(cls, field_name, members):
+        """
+        Make the many to many relation field_name match members, a dict of group pk -> set of member pks.
+        The current relations are diffed in memory: only the missing pairs are inserted and only the
+        obsolete pairs are deleted. Groups that are not in members are not touched.
+        Returns the number of added and removed pairs.
+        """
+        with phase(cls, 'membership'):
+            added, removed = cls._sync_members(field_name, members)
+        record_count(cls, 'members_added', added)
+        record_count(cls, 'members_removed', removed)
+        return added, removed
+
+    @classmethod
+    def _sync_members(cls, field_name, members):
+        field = cls._meta.get_field(field_name)
+        through = field.remote_field.through
+        group_column = through._meta.get_field(field.m2m_field_name()).attname
+        member_column = through._meta.get_field(field.m2m_reverse_field_name()).attname
+        current = defaultdict(set)
+        obsolete = []
+        for batch in chunks(list(members), settings.NAGIOS_CACHE_BATCH_SIZE):
+            query = through.objects.filter(**{'%s__in' % group_column: batch})
+            for pk, group_id, member_id in query.values_list('pk', group_column, member_column):
+                if member_id in members[group_id]:
+                    current[group_id].add(member_id)
+                else:
+                    obsolete.append(pk)
+        for batch in chunks(obsolete, settings.NAGIOS_CACHE_BATCH_SIZE):
+            through.objects.filter(pk__in=batch).delete()
+        added = [through(**{group_column: group_id, member_column: member_id})
+                 for group_id, member_ids in members.items()
+                 for member_id in member_ids - current[group_id]]
+        through.objects.bulk_create(added, batch_size=settings.NAGIOS_CACHE_BATCH_SIZE)
+        return len(added), len(obsolete)
+
+
+class NagiosHostgroup(NagiosGroup):
     hosts = models.ManyToManyField(NagiosHostStatus)
 
     suffix = 'hostgroup=all&style=overview&jsonoutput'
     suffix_single = 'hostgroup=%s&style=overview&jsonoutput'
     suffix_services = 'hostgroup=%s&style=detail&jsonoutput'
 
-    def __unicode__(self):
-        return self.name
-
     @staticmethod
-    def __import_hostgroup(hostgroup, hostgroup_members, fail_logger, current_time, import_services=False):
+    def __host_ids(hostgroup, hostgroup_members, host_ids, fail_logger):
+        """
+        Map the members of a hostgroup to the primary keys of the hosts.
+        Returns the primary keys and the number of members that were not found.
+        """
+        ids = set()
+        missing = 0
         for i in hostgroup_members:
-            try:
-                h = NagiosHostStatus.objects.get(host_name=i['host_name'])
-                hostgroup.hosts.add(h)
-            except:
+            if i['host_name'] in host_ids:
+                ids.add(host_ids[i['host_name']])
+            else:
+                missing += 1
                 fail_logger('Could not find host %s. Not adding it to hostgroup %s' % (i['host_name'], hostgroup.name))
-        if import_services:
-            NagiosServiceStatus.import_from_url(current_time, NagiosHostgroup.suffix_services % hostgroup.name)
-        hostgroup.save()
+        return ids, missing
 
     @staticmethod
     def import_single(current_time, hostgroup, import_services=False):
         """
         With this method we ca import a single hostgroup
         """
+        if import_services:
+            NagiosHostgroup.import_services(current_time, [hostgroup])
+            return
         NagiosHostgroup.run_autoclean()
-        if not NagiosHostgroup.objects.filter(name=hostgroup).exists():
+        if not NagiosHostgroup.source_objects().filter(name=hostgroup).exists():
             raise Exception('NagiosHostgroup %s does not exist in database' % hostgroup)
-        hostgroup = NagiosHostgroup.objects.get(name=hostgroup)
+        hostgroup = NagiosHostgroup.source_objects().get(name=hostgroup)
         hostgroup.last_database_update = current_time
-        hostgroup.hosts.clear()
-        items = NagiosHostgroup.get_json_from_url(NagiosHostgroup.suffix_single % hostgroup)
+        NagiosSyncState.forget(NagiosHostgroup.sync_state_name(NagiosHostgroup.suffix))
+        items = NagiosHostgroup.get_json_from_url(NagiosHostgroup.suffix_single % hostgroup.name)
         nagios_list = items['status']['hostgroup_overview'][0]['members']
-        log.info('Importing NagiosHostgroup %s with %s members from %s' % (hostgroup, len(nagios_list), NagiosHostgroup.get_nagios_url(NagiosHostgroup.suffix_single % hostgroup)))
-        NagiosHostgroup.__import_hostgroup(hostgroup, nagios_list, log.warn, current_time, import_services)
+        log.info('Importing NagiosHostgroup %s with %s members from %s' % (hostgroup.name, len(nagios_list), NagiosHostgroup.get_nagios_url(NagiosHostgroup.suffix_single % hostgroup.name)))
+        host_ids = NagiosHostStatus.pk_index()
+        ids = NagiosHostgroup.__host_ids(hostgroup, nagios_list, host_ids, log.warn)[0]
+        NagiosHostgroup.sync_members('hosts', {hostgroup.pk: ids})
+        hostgroup.save()
+        bump_generation()
 
+    @staticmethod
+    def import_services(current_time, names):
+        """
+        Import the given hostgroups and the services of all their hosts. Hosts are often in several
+        hostgroups, so the services are imported once for the union of the hosts, and the services of a
+        hostgroup are only downloaded if it has hosts the other downloads do not cover, see
+        covering_hostgroups(). With more than settings.NAGIOS_CACHE_HOSTGROUP_SERVICES_LIMIT hostgroups
+        all services are downloaded with one request and filtered here, instead of one request per hostgroup.
+        """
+        NagiosHostgroup.run_autoclean()
+        names = list(OrderedDict.fromkeys(names))
+        hostgroups = dict((group.name, group) for group in NagiosHostgroup.source_objects().filter(name__in=names))
+        for name in names:
+            if name not in hostgroups:
+                raise Exception('NagiosHostgroup %s does not exist in database' % name)
+        results = NagiosHostgroup.get_json_from_urls([NagiosHostgroup.suffix_single % name for name in names])
+        host_ids = NagiosHostStatus.pk_index()
+        members = {}
+        group_hosts = OrderedDict()
+        for name, items in zip(names, results):
+            nagios_list = items['status']['hostgroup_overview'][0]['members']
+            log.info('Importing NagiosHostgroup %s with %s members from %s' % (name, len(nagios_list), NagiosHostgroup.get_nagios_url(NagiosHostgroup.suffix_single % name)))
+            group_hosts[name] = set(i['host_name'] for i in nagios_list)
+            members[hostgroups[name].pk] = NagiosHostgroup.__host_ids(hostgroups[name], nagios_list, host_ids, log.warn)[0]
+        NagiosHostgroup.sync_members('hosts', members)
+        NagiosSyncState.forget(NagiosHostgroup.sync_state_name(NagiosHostgroup.suffix))
+        if len(names) > settings.NAGIOS_CACHE_HOSTGROUP_SERVICES_LIMIT:
+            host_names = set(chain.from_iterable(group_hosts.values()))
+            NagiosServiceStatus.import_from_urls(current_time, [NagiosServiceStatus.suffix], host_names)
+        else:
+            NagiosServiceStatus.import_from_urls(current_time, [NagiosHostgroup.suffix_services % name for name in
+                                                                NagiosHostgroup.covering_hostgroups(group_hosts)])
+        NagiosHostgroup.objects.filter(pk__in=[group.pk for group in hostgroups.values()]).update(last_database_update=current_time)
+        bump_generation()
+
+    @staticmethod
+    def covering_hostgroups(group_hosts):
+        """
+        Return the names of the hostgroups whose services have to be downloaded to get the services of all
+        hosts of group_hosts, an ordered dict name -> set of host names. Starting with the largest one, a
+        hostgroup is only chosen if it has a host that the chosen hostgroups do not have.
+        """
+        names = []
+        covered = set()
+        for name in sorted(group_hosts, key=lambda name: len(group_hosts[name]), reverse=True):
+            if group_hosts[name] - covered:
+                names.append(name)
+                covered |= group_hosts[name]
+        return names
 
     @staticmethod
     def import_all(current_time):
         NagiosHostgroup.run_autoclean()
-        items = NagiosHostgroup.get_json_from_url(NagiosHostgroup.suffix)
+        state = NagiosSyncState.get_state(NagiosHostgroup.sync_state_name(NagiosHostgroup.suffix))
+        try:
+            items = NagiosHostgroup.get_json_from_url(NagiosHostgroup.suffix, state=state)
+        except NotModified:
+            # The overview contains the members, so nothing changed
+            NagiosHostgroup.source_objects().filter(last_database_update__gte=state.last_sync).update(last_database_update=current_time)
+            state.last_sync = current_time
+            state.save()
+            bump_generation()
+            return
         nagios_list = items['status']['hostgroup_overview']
         log.info('Importing %s NagiosHostgroup from %s' % (len(nagios_list), NagiosHostgroup.get_nagios_url(NagiosHostgroup.suffix)))
         t = timezone.now()
+        hostgroups = NagiosHostgroup.get_or_create_groups([i['hostgroup_name'] for i in nagios_list], current_time)
+        # Preload the primary keys of all hosts, so we do not have to query them for every member
+        host_ids = NagiosHostStatus.pk_index()
+        members = {}
+        missing = 0
         for current_hostgroup in nagios_list:
-            current_hostgroup_obj, created = NagiosHostgroup.objects.get_or_create(name=current_hostgroup['hostgroup_name'])
-            current_hostgroup_obj.last_database_update = current_time
-            current_hostgroup_obj.hosts.clear()
-            NagiosHostgroup.__import_hostgroup(current_hostgroup_obj, current_hostgroup['members'], log.error, current_time)
-        log.debug('Import took %s seconds' % (timezone.now() - t))
+            current_hostgroup_obj = hostgroups[current_hostgroup['hostgroup_name']]
+            members[current_hostgroup_obj.pk], group_missing = NagiosHostgroup.__host_ids(current_hostgroup_obj, current_hostgroup['members'], host_ids, log.error)
+            missing += group_missing
+        added, removed = NagiosHostgroup.sync_members('hosts', members)
+        if missing:
+            # The missing hosts have to be added with the next response even if it did not change
+            state.forget_response()
+        log.debug('Import took %s seconds (%s members added, %s removed)' % (timezone.now() - t, added, removed))
+        state.last_sync = current_time
+        state.save()
+        bump_generation()
 
 
-class NagiosServicegroup(NagiosImportable):
-    name = models.CharField(max_length=200)
+class NagiosServicegroup(NagiosGroup):
     services = models.ManyToManyField(NagiosServiceStatus)
 
     suffix = 'servicegroup=all&style=overview&jsonoutput'
     suffix_single = 'servicegroup=%s&style=detail&jsonoutput'
 
-    def __unicode__(self):
-        return self.name
-
     @staticmethod
-    def __import_servicegroup(servicegroup, members, fail_logger):
+    def __service_ids(servicegroup, members, service_ids, fail_logger):
+        """
+        Map the members of a servicegroup to the primary keys of the services.
+        Returns the primary keys and the number of members that were not found.
+        """
+        ids = set()
+        missing = 0
         for i in members:
-            try:
-                s = NagiosServiceStatus.objects.get(service_description=i['service_description'],
-                                                    host__host_name=i['host_name'])
-                servicegroup.services.add(s)
-            except:
+            key = (i['host_name'], i['service_description'])
+            if key in service_ids:
+                ids.add(service_ids[key])
+            else:
+                missing += 1
                 fail_logger('Could not find service %s on %s . Not adding it to servicegroup %s' % (i['service_description'], i['host_name'], servicegroup.name))
-        servicegroup.save()
+        return ids, missing
 
     @staticmethod
     def import_single(current_time, group_name):
@@ -305,15 +936,31 @@ class NagiosServicegroup(NagiosImportable):
         With this method we can import a single servicegroup
         """
         NagiosServicegroup.run_autoclean()
-        if not NagiosServicegroup.objects.filter(name=group_name).exists():
+        if not NagiosServicegroup.source_objects().filter(name=group_name).exists():
             raise Exception('NagiosServiceGroup %s does not exist in database' % group_name)
-        json_result = NagiosServicegroup.get_json_from_url(NagiosServicegroup.suffix_single % group_name)
-        nagios_services = json_result['status']['service_status']
-        group = NagiosServicegroup.objects.get(name=group_name)
+        group = NagiosServicegroup.source_objects().get(name=group_name)
         group.last_database_update = current_time
-        group.services.clear()
+        state = NagiosSyncState.get_state(NagiosServicegroup.sync_state_name(NagiosServicegroup.suffix_single % group_name))
+        try:
+            json_result = NagiosServicegroup.get_json_from_url(NagiosServicegroup.suffix_single % group_name, state=state)
+        except NotModified:
+            group.save()
+            state.last_sync = current_time
+            state.save()
+            bump_generation()
+            return
+        nagios_services = json_result['status']['service_status']
         log.info('Importing NagiosServicegroup %s with %s members from %s' % (group_name, len(nagios_services), NagiosServicegroup.get_nagios_url(NagiosServicegroup.suffix_single % group_name)))
-        NagiosServicegroup.__import_servicegroup(group, nagios_services, log.warn)
+        service_ids = NagiosServiceStatus.pk_index()
+        ids, missing = NagiosServicegroup.__service_ids(group, nagios_services, service_ids, log.warn)
+        NagiosServicegroup.sync_members('services', {group.pk: ids})
+        if missing:
+            # The missing services have to be added with the next response even if it did not change
+            state.forget_response()
+        group.save()
+        state.last_sync = current_time
+        state.save()
+        bump_generation()
 
     @staticmethod
     def import_all(current_time):
@@ -322,11 +969,356 @@ class NagiosServicegroup(NagiosImportable):
         nagios_service_groups = json_result['status']['servicegroup_overview']
         log.info('Importing %s NagiosServicegroup from %s' % (len(nagios_service_groups), NagiosServicegroup.get_nagios_url(NagiosServicegroup.suffix)))
         t = timezone.now()
-        for current_service_group in nagios_service_groups:
-            current_servicegroup_obj, created = NagiosServicegroup.objects.get_or_create(name=current_service_group['servicegroup_name'])
-            current_servicegroup_obj.last_database_update = current_time
-            current_servicegroup_obj.services.clear()
-            service_group_checks = NagiosServicegroup.get_json_from_url(NagiosServicegroup.suffix_single % current_servicegroup_obj.name)
+        servicegroups = NagiosServicegroup.get_or_create_groups([i['servicegroup_name'] for i in nagios_service_groups], current_time)
+        servicegroup_objs = [servicegroups[i['servicegroup_name']] for i in nagios_service_groups]
+        # The details of the servicegroups are downloaded in parallel, the import happens here.
+        # They rarely change, the members of a group with an unchanged detail response are not synced.
+        suffixes = [NagiosServicegroup.suffix_single % obj.name for obj in servicegroup_objs]
+        states = NagiosSyncState.get_states([NagiosServicegroup.sync_state_name(suffix) for suffix in suffixes])
+        results = NagiosServicegroup.get_json_from_urls(suffixes, states)
+        # Preload the primary keys of all services, so we do not have to query them for every member
+        service_ids = NagiosServiceStatus.pk_index()
+        members = {}
+        for current_servicegroup_obj, service_group_checks, state in zip(servicegroup_objs, results, states):
+            if service_group_checks is None:
+                continue
             log.debug('Importing %s services for service group %s' % (len(service_group_checks['status']['service_status']), current_servicegroup_obj.name))
-            NagiosServicegroup.__import_servicegroup(current_servicegroup_obj, service_group_checks['status']['service_status'], log.error)
-        log.debug('Import took %s seconds' % (timezone.now() - t))
+            members[current_servicegroup_obj.pk], missing = NagiosServicegroup.__service_ids(current_servicegroup_obj, service_group_checks['status']['service_status'], service_ids, log.error)
+            if missing:
+                state.forget_response()
+        added, removed = NagiosServicegroup.sync_members('services', members)
+        log.debug('Import took %s seconds (%s members added, %s removed, %s groups unchanged)' % (
+            timezone.now() - t, added, removed, len(servicegroup_objs) - len(members)))
+        for state in states:
+            state.last_sync = current_time
+        bulk_update(NagiosSyncState, states, ['last_sync', 'etag', 'last_modified', 'body_hash'],
+                    batch_size=settings.NAGIOS_CACHE_BATCH_SIZE)
+        bump_generation()
+
+
+class NagiosSyncState(models.Model):
+    """
+    Bookkeeping of the importers. There is one entry per imported URL.
+    """
+    name = models.CharField(max_length=200, unique=True)
+    # The start time of the last import
+    last_sync = models.DateTimeField(null=True)
+    # The newest last_check seen in the last import. This is the watermark of the incremental sync.
+    last_check = models.DateTimeField(null=True)
+    # The validators of the last imported response, they make the next request conditional
+    etag = models.CharField(max_length=200, blank=True, default='')
+    last_modified = models.CharField(max_length=50, blank=True, default='')
+    # SHA-1 of the body of the last imported response, empty if it was streamed
+    body_hash = models.CharField(max_length=40, blank=True, default='')
+
+    def __unicode__(self):
+        return self.name
+
+    @classmethod
+    def get_state(cls, name):
+        state, created = cls.objects.get_or_create(name=name)
+        return state
+
+    @classmethod
+    def get_states(cls, names):
+        """
+        Return the states of names in the same order, the missing ones are created
+        """
+        states = {}
+        for batch in chunks(names, settings.NAGIOS_CACHE_BATCH_SIZE):
+            states.update((state.name, state) for state in cls.objects.filter(name__in=batch))
+        missing = [name for name in OrderedDict.fromkeys(names) if name not in states]
+        if missing:
+            cls.objects.bulk_create([cls(name=name) for name in missing], batch_size=settings.NAGIOS_CACHE_BATCH_SIZE)
+            for batch in chunks(missing, settings.NAGIOS_CACHE_BATCH_SIZE):
+                states.update((state.name, state) for state in cls.objects.filter(name__in=batch))
+        return [states[name] for name in names]
+
+    def request_headers(self):
+        """
+        The headers of a conditional request, none if settings.NAGIOS_CACHE_SKIP_UNCHANGED is disabled
+        """
+        headers = {}
+        if not settings.NAGIOS_CACHE_SKIP_UNCHANGED:
+            return headers
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def is_unchanged(self, body_hash):
+        return settings.NAGIOS_CACHE_SKIP_UNCHANGED and body_hash == self.body_hash
+
+    def forget_response(self):
+        self.etag = self.last_modified = self.body_hash = ''
+
+    @classmethod
+    def forget(cls, name):
+        """
+        Forget the last response of the state name, e.g. because another import changed its data
+        """
+        cls.objects.filter(name=name).update(etag='', last_modified='', body_hash='')
+
+    @classmethod
+    def forget_models(cls, model_classes):
+        """
+        Forget the last responses of all imports of the given models from every source, see sync_state_name()
+        """
+        for model in model_classes:
+            cls.objects.filter(name__contains=':%s?' % model.__name__).update(etag='', last_modified='', body_hash='')
+
+    def set_response(self, response, body_hash):
+        """
+        Remember a new response. It is saved with the import of the response.
+        """
+        self.etag = response.headers.get('ETag', '')[:200]
+        self.last_modified = response.headers.get('Last-Modified', '')[:50]
+        self.body_hash = body_hash
+
+
+class NagiosStateTransition(models.Model):
+    """
+    History of the status of hosts and services. The importers append an entry whenever the status or
+    the state type of a host or service changed, so the table grows with the number of state changes
+    and not with the number of syncs. The transitions of a host have no service.
+    The foreign keys have no database constraints, the transitions are no part of the
+    sync transaction of the referenced tables (see nagios_cache.shadow). Removing a host or service
+    does not remove its transitions, only prune() does after settings.NAGIOS_CACHE_HISTORY_DAYS.
+    """
+    host = models.ForeignKey(NagiosHostStatus, related_name='transitions', on_delete=models.DO_NOTHING,
+                             db_constraint=False, db_index=False)
+    service = models.ForeignKey(NagiosServiceStatus, null=True, related_name='transitions', on_delete=models.DO_NOTHING,
+                                db_constraint=False, db_index=False)
+    # The time of the state change
+    time = models.DateTimeField()
+    status = models.SmallIntegerField(choices=NagiosStatus.STATUS)
+    state_type = models.SmallIntegerField(choices=NagiosStatus.STATE_TYPE)
+    # None for the first known state of an entry
+    previous_status = models.SmallIntegerField(choices=NagiosStatus.STATUS, null=True)
+
+    class Meta:
+        index_together = [['service', 'time'], ['host', 'time']]
+
+    def __unicode__(self):
+        return '%s %s' % (self.time, self.get_status_display())
+
+    @classmethod
+    def enabled(cls):
+        return settings.NAGIOS_CACHE_HISTORY
+
+    @classmethod
+    def record(cls, model, transitions):
+        """
+        Insert a list of (import_key, transition) of model. Transitions of created entries whose primary key
+        the database did not return get it from one lookup of these entries.
+        """
+        missing = [key for key, transition in transitions if getattr(transition, model.transition_attname) is None]
+        if missing:
+            pks = model.pk_index(missing)
+            for key, transition in transitions:
+                if getattr(transition, model.transition_attname) is None:
+                    setattr(transition, model.transition_attname, pks[key[0] if len(key) == 1 else key])
+        cls.objects.bulk_create([transition for key, transition in transitions],
+                                batch_size=settings.NAGIOS_CACHE_BATCH_SIZE)
+        record_count(model, 'transitions', len(transitions))
+
+    @classmethod
+    def prune(cls, days, batch_size=None, report=None):
+        """
+        Remove the transitions older than days in chunks of batch_size (default settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE)
+        primary keys, each in its own transaction. The previous_status of the remaining transitions still tells
+        the state at their beginning, see state_at(). Returns the number of removed transitions.
+        """
+        query = cls.objects.filter(time__lt=timezone.now() - timedelta(days=days))
+        if batch_size is None:
+            batch_size = settings.NAGIOS_CACHE_CLEAN_BATCH_SIZE
+        if not batch_size:
+            count, _ = query.delete()
+            return count
+        total = 0
+        batch = 0
+        while True:
+            pks = list(query.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            batch += 1
+            with transaction.atomic():
+                query.filter(pk__gte=pks[0], pk__lte=pks[-1]).delete()
+            total += len(pks)
+            if report is not None:
+                report(batch, len(pks))
+        log.debug('Removed %s transitions that are older than %s days' % (total, days))
+        return total
+
+    @classmethod
+    def for_object(cls, obj):
+        """
+        The transitions of a NagiosHostStatus or NagiosServiceStatus
+        """
+        if isinstance(obj, NagiosServiceStatus):
+            return cls.objects.filter(service=obj)
+        return cls.objects.filter(host=obj, service__isnull=True)
+
+    @classmethod
+    def state_at(cls, obj, moment):
+        """
+        The status of obj at moment, None if it is unknown
+        """
+        transitions = cls.for_object(obj)
+        status = transitions.filter(time__lte=moment).order_by('-time').values_list('status', flat=True).first()
+        if status is not None:
+            return status
+        later = list(transitions.filter(time__gt=moment).order_by('time').values_list('previous_status', flat=True)[:1])
+        if later:
+            return later[0]
+        if obj.last_database_update - obj.duration <= moment:
+            # The transitions were pruned, but the state did not change since
+            return obj.status
+        return None
+
+    @classmethod
+    def time_in_state(cls, obj, start, end=None):
+        """
+        Return a dict status -> timedelta of the time obj spent in every status between start and
+        end (default now). Times where the status is unknown are not part of it.
+        """
+        end = end or timezone.now()
+        changes = cls.for_object(obj).filter(time__gt=start, time__lt=end).order_by('time').values_list('time', 'status')
+        result = defaultdict(timedelta)
+        status, since = cls.state_at(obj, start), start
+        for changed, new_status in changes:
+            if status is not None:
+                result[status] += changed - since
+            status, since = new_status, changed
+        if status is not None:
+            result[status] += end - since
+        return dict(result)
+
+    @classmethod
+    def availability(cls, obj, start, end=None, statuses=(NagiosStatus.STATUS_OK, NagiosStatus.STATUS_UP)):
+        """
+        The fraction of the known time between start and end (default now) obj was in one of statuses,
+        None if its status is unknown in the complete range
+        """
+        times = cls.time_in_state(obj, start, end)
+        total = sum(times.values(), timedelta())
+        if not total:
+            return None
+        return sum((times[status] for status in statuses if status in times), timedelta()).total_seconds() / total.total_seconds()
+
+
+class NagiosStatusSummary(models.Model):
+    """
+    Precomputed number of services per status for every host, hostgroup and servicegroup.
+    It is rebuilt after every sync in the same transaction, so overview pages only need to read
+    one row per object instead of joining all services. last_database_update is the time the row changed.
+    """
+    KIND_HOST = 1
+    KIND_HOSTGROUP = 2
+    KIND_SERVICEGROUP = 3
+
+    KIND = [
+        [KIND_HOST, 'host'],
+        [KIND_HOSTGROUP, 'hostgroup'],
+        [KIND_SERVICEGROUP, 'servicegroup'],
+    ]
+
+    # The field name of the counter and the condition for the services that are counted
+    COUNTERS = [
+        ('ok', {'status': NagiosStatus.STATUS_OK}),
+        ('warning', {'status': NagiosStatus.STATUS_WARNING}),
+        ('critical', {'status': NagiosStatus.STATUS_CRITICAL}),
+        ('unknown', {'status': NagiosStatus.STATUS_UNKNOWN}),
+        ('pending', {'status': NagiosStatus.STATUS_PENDING}),
+        ('hard', {'state_type': NagiosStatus.STATE_TYPE_HARD}),
+        ('soft', {'state_type': NagiosStatus.STATE_TYPE_SOFT}),
+        ('acknowledged', {'has_been_acknowledged': True}),
+        ('in_scheduled_downtime', {'in_scheduled_downtime': True}),
+    ]
+
+    kind = models.SmallIntegerField(choices=KIND)
+    object_id = models.IntegerField()
+    name = models.CharField(max_length=200)
+    source = models.CharField(max_length=50, default=DEFAULT_SOURCE, editable=False, db_index=True)
+    last_database_update = models.DateTimeField(default=timezone.now, editable=False)
+    total = models.IntegerField(default=0)
+    ok = models.IntegerField(default=0)
+    warning = models.IntegerField(default=0)
+    critical = models.IntegerField(default=0)
+    unknown = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    hard = models.IntegerField(default=0)
+    soft = models.IntegerField(default=0)
+    acknowledged = models.IntegerField(default=0)
+    in_scheduled_downtime = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['kind', 'object_id']]
+        verbose_name_plural = 'nagios status summaries'
+
+    def __unicode__(self):
+        return '%s %s' % (self.get_kind_display(), self.name)
+
+    @classmethod
+    def count_services(cls, group_by):
+        """
+        Count the services of the active source per value of group_by (e.g. 'host') with one aggregate query.
+        Returns a dict value -> dict of counters.
+        """
+        counters = dict((name, Sum(Case(When(then=1, **condition), default=0, output_field=IntegerField())))
+                        for name, condition in cls.COUNTERS)
+        counters['total'] = Count('id')
+        query = NagiosServiceStatus.source_objects().filter(**{'%s__isnull' % group_by: False}).order_by()
+        return dict((row.pop(group_by), row) for row in query.values(group_by).annotate(**counters))
+
+    @classmethod
+    def rebuild(cls, current_time):
+        """
+        Recompute all summaries of the active source. Call it inside the transaction of the import.
+        The counts are compared with the stored rows, only the rows whose counts or name changed are
+        written and only the rows of removed hosts and groups are deleted.
+        """
+        fields = ['name', 'total'] + [name for name, condition in cls.COUNTERS]
+        existing = dict(((row[0], row[1]), row[2:]) for row in
+                        cls.objects.filter(source=get_source()).values_list('kind', 'object_id', 'id', *fields))
+        created = []
+        changed = []
+        for kind, group_by, names in [
+                (cls.KIND_HOST, 'host', NagiosHostStatus.source_objects().values_list('id', 'host_name')),
+                (cls.KIND_HOSTGROUP, 'host__nagioshostgroup', NagiosHostgroup.source_objects().values_list('id', 'name')),
+                (cls.KIND_SERVICEGROUP, 'nagiosservicegroup', NagiosServicegroup.source_objects().values_list('id', 'name'))]:
+            counts = cls.count_services(group_by)
+            for object_id, name in names:
+                values = dict.fromkeys(fields, 0)
+                values.update(counts.get(object_id, {}), name=name)
+                row = existing.pop((kind, object_id), None)
+                if row is not None and tuple(values[field] for field in fields) == tuple(row[1:]):
+                    continue
+                summary = cls(kind=kind, object_id=object_id, source=get_source(), last_database_update=current_time,
+                              **values)
+                if row is None:
+                    created.append(summary)
+                else:
+                    summary.id = row[0]
+                    changed.append(summary)
+        # The rows that are left belong to hosts and groups that were removed
+        obsolete = [row[0] for row in existing.values()]
+        for batch in chunks(obsolete, settings.NAGIOS_CACHE_BATCH_SIZE):
+            cls.objects.filter(pk__in=batch).delete()
+        bulk_update(cls, changed, fields + ['last_database_update'], batch_size=settings.NAGIOS_CACHE_BATCH_SIZE)
+        cls.objects.bulk_create(created, batch_size=settings.NAGIOS_CACHE_BATCH_SIZE)
+        if created or changed or obsolete:
+            bump_generation()
+
+    @classmethod
+    def hosts(cls):
+        return cls.objects.filter(kind=cls.KIND_HOST).order_by('name')
+
+    @classmethod
+    def hostgroups(cls):
+        return cls.objects.filter(kind=cls.KIND_HOSTGROUP).order_by('name')
+
+    @classmethod
+    def servicegroups(cls):
+        return cls.objects.filter(kind=cls.KIND_SERVICEGROUP).order_by('name')
@@ -0,0 +1,67 @@
+
+
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import parsedatetime
+import pytz
+
+# The formats Icinga/Nagios uses in the jsonoutput of status.cgi
+DURATION_RE = re.compile(r'^\s*(\d+)d\s+(\d+)h\s+(\d+)m\s+(\d+)s\+?\s*$')
+# date_format=us (MM-DD-YYYY HH:MM:SS) and date_format=iso8601 (YYYY-MM-DD HH:MM:SS)
+US_DATETIME_RE = re.compile(r'^(\d{2})-(\d{2})-(\d{4})[ T](\d{2}):(\d{2}):(\d{2})$')
+ISO_DATETIME_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2}):(\d{2})$')
+
+_calendar = parsedatetime.Calendar()
+
+
+@lru_cache(maxsize=1024)
+def _parse_duration(value):
+    match = DURATION_RE.match(value)
+    if match is None:
+        return None
+    days, hours, minutes, seconds = map(int, match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+@lru_cache(maxsize=4096)
+def _parse_datetime(value):
+    try:
+        match = US_DATETIME_RE.match(value)
+        if match is not None:
+            month, day, year, hour, minute, second = map(int, match.groups())
+            return pytz.utc.localize(datetime(year, month, day, hour, minute, second))
+        match = ISO_DATETIME_RE.match(value)
+        if match is not None:
+            return pytz.utc.localize(datetime(*map(int, match.groups())))
+    except ValueError:
+        # E.g. a day first date (date_format=euro) matches the US format, parsedatetime handles it
+        pass
+    return None
+
+
+def parse_duration(value, current_time):
+    """
+    Parse a Nagios duration like '0d 1h 2m 3s' into a timedelta.
+    Other formats are handled by parsedatetime relative to current_time.
+    """
+    duration = _parse_duration(value)
+    if duration is None:
+        # We need to do this to make the nagios time timezone aware
+        future_time, _ = _calendar.parse(value)
+        duration = pytz.utc.localize(datetime(*future_time[:6])) - current_time
+    return duration
+
+
+def parse_datetime(value):
+    """
+    Parse a Nagios timestamp like '10-18-2016 12:00:00' into a timezone aware datetime.
+    Repeated values (most checks run at the same time) are answered from a cache.
+    Other formats are handled by parsedatetime.
+    """
+    parsed = _parse_datetime(value)
+    if parsed is None:
+        parsed, _ = _calendar.parse(value)
+        parsed = pytz.utc.localize(datetime(*parsed[:6]))
+    return parsed
@@ -0,0 +1,111 @@
+
+
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from nagios_cache.cache import get_cache, make_key
+from nagios_cache.models import NagiosStatus, NagiosHostStatus, NagiosServiceStatus
+
+PROBLEM_STATUS = [
+    NagiosStatus.STATUS_DOWN,
+    NagiosStatus.STATUS_WARNING,
+    NagiosStatus.STATUS_CRITICAL,
+    NagiosStatus.STATUS_UNKNOWN,
+    NagiosStatus.STATUS_UNREACHABLE,
+]
+
+# The default of cache.get(), a cached result may be None
+MISSING = object()
+
+
+def cached_query(func):
+    """
+    Cache the result of func in the Django cache until the next sync is committed or
+    settings.NAGIOS_CACHE_QUERY_TIMEOUT seconds passed. A cache hit does not query the database.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = get_cache()
+        key = make_key(func.__name__, *args, **kwargs)
+        result = cache.get(key, MISSING)
+        if result is MISSING:
+            result = func(*args, **kwargs)
+            cache.set(key, result, settings.NAGIOS_CACHE_QUERY_TIMEOUT)
+        return result
+    return wrapper
+
+
+@cached_query
+def problems(hostgroup=None, servicegroup=None, state_type=None):
+    """
+    Services in a problem state, optionally limited to a hostgroup, a servicegroup and a state type
+    """
+    query = NagiosServiceStatus.objects.filter(status__in=PROBLEM_STATUS).select_related('host')
+    if hostgroup is not None:
+        query = query.filter(host__nagioshostgroup__name=hostgroup)
+    if servicegroup is not None:
+        query = query.filter(nagiosservicegroup__name=servicegroup)
+    if state_type is not None:
+        query = query.filter(state_type=state_type)
+    return list(query.order_by('host_name', 'service_description'))
+
+
+def problems_by_hostgroup(hostgroup):
+    return problems(hostgroup=hostgroup)
+
+
+def problems_by_servicegroup(servicegroup):
+    return problems(servicegroup=servicegroup)
+
+
+@cached_query
+def host_problems(hostgroup=None):
+    """
+    Hosts that are DOWN or UNREACHABLE, optionally limited to a hostgroup
+    """
+    query = NagiosHostStatus.objects.filter(status__in=PROBLEM_STATUS)
+    if hostgroup is not None:
+        query = query.filter(nagioshostgroup__name=hostgroup)
+    return list(query.order_by('host_name'))
+
+
+@cached_query
+def count_by_status(hostgroup=None, servicegroup=None):
+    """
+    Return a dict status -> number of services, optionally limited to a hostgroup or servicegroup
+    """
+    query = NagiosServiceStatus.objects.all()
+    if hostgroup is not None:
+        query = query.filter(host__nagioshostgroup__name=hostgroup)
+    if servicegroup is not None:
+        query = query.filter(nagiosservicegroup__name=servicegroup)
+    return dict(query.order_by().values_list('status').annotate(count=Count('id')))
+
+
+@cached_query
+def count_hosts_by_status():
+    """
+    Return a dict status -> number of hosts
+    """
+    return dict(NagiosHostStatus.objects.order_by().values_list('status').annotate(count=Count('id')))
+
+
+@cached_query
+def services_for_host(host_name):
+    """
+    All services of a host
+    """
+    return list(NagiosServiceStatus.objects.filter(host_name=host_name).select_related('host')
+                .order_by('service_description'))
+
+
+@cached_query
+def last_database_update():
+    """
+    The time of the newest imported host or service, None if there are none
+    """
+    times = [model.objects.aggregate(last=Max('last_database_update'))['last']
+             for model in [NagiosHostStatus, NagiosServiceStatus]]
+    return max([t for t in times if t is not None] or [None])
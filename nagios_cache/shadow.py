@@ -0,0 +1,198 @@
+
+
+import logging
+import re
+import time
+
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from nagios_cache.cache import bump_generation
+from nagios_cache.models import NagiosHostStatus, NagiosServiceStatus, NagiosHostgroup, NagiosServicegroup, NagiosStatusSummary
+from nagios_cache.models import NagiosStateTransition, NagiosStatus, NagiosSyncState
+
+log = logging.getLogger(__name__)
+
+# Shadow tables of an aborted sync are dropped after this many seconds. A younger one may still be
+# loaded by another process.
+STALE_TABLE_SECONDS = 6 * 3600
+
+# The models that are loaded into shadow tables, parents before children.
+# The sync states describe the responses of the loaded data, so they start empty as well.
+SHADOW_MODELS = [NagiosHostStatus, NagiosServiceStatus, NagiosHostgroup, NagiosServicegroup, NagiosStatusSummary,
+                 NagiosSyncState]
+
+
+def shadow_models():
+    """
+    SHADOW_MODELS and their many to many tables, parents before children
+    """
+    result = []
+    for model in SHADOW_MODELS:
+        result.append(model)
+        for field in model._meta.local_many_to_many:
+            result.append(field.remote_field.through)
+    return result
+
+
+@contextmanager
+def use_tables(suffix):
+    """
+    Let the shadow models use the tables <db_table>_<suffix> inside the with block.
+    The hosts and services remember their table in live_db_table, see NagiosStatus.live_rows().
+    This changes the models for the complete process, so only use it in a sync process.
+    """
+    originals = [(model, model._meta.db_table) for model in shadow_models()]
+    for model, db_table in originals:
+        set_db_table(model, '%s_%s' % (db_table, suffix))
+        if issubclass(model, NagiosStatus):
+            model.live_db_table = db_table
+    try:
+        yield
+    finally:
+        for model, db_table in originals:
+            set_db_table(model, db_table)
+            if issubclass(model, NagiosStatus):
+                model.live_db_table = None
+
+
+def set_db_table(model, db_table):
+    model._meta.db_table = db_table
+    # The fields cache their column expression with the table name
+    for field in model._meta.concrete_fields:
+        field.__dict__.pop('cached_col', None)
+
+
+def drop_tables(suffix):
+    with use_tables(suffix), connection.schema_editor() as editor:
+        # Deleting a model also deletes its many to many tables
+        for model in reversed(SHADOW_MODELS):
+            editor.delete_model(model)
+
+
+def drop_stale_tables():
+    """
+    Drop the shadow tables of syncs that were aborted. They may be incomplete, so we drop every
+    table on its own. The suffix of a table is its creation time, tables younger than
+    STALE_TABLE_SECONDS are kept because another sync may still load them.
+    """
+    table_names = connection.introspection.table_names()
+    stale = []
+    created_before = (time.time() - STALE_TABLE_SECONDS) * 1000
+    for model in reversed(shadow_models()):
+        pattern = re.compile(r'^%s_[so](\d+)$' % re.escape(model._meta.db_table))
+        for table_name in table_names:
+            match = pattern.match(table_name)
+            if match and int(match.group(1)) < created_before:
+                stale.append(table_name)
+    if not stale:
+        return
+    log.warning('Dropping the shadow tables of an aborted sync: %s' % ', '.join(stale))
+    with connection.schema_editor() as editor:
+        for table_name in stale:
+            editor.execute(editor.sql_delete_table % {'table': editor.quote_name(table_name)})
+
+
+def continue_ids(model, suffix):
+    """
+    Let the shadow table of a host or service model number its new entries after the primary keys of
+    the table of the readers and of the transitions. The shadow load reuses the primary keys of the
+    entries that already exist, so a new entry must neither take one of them nor the primary key of a
+    removed entry that still has transitions.
+    """
+    quote = connection.ops.quote_name
+    db_table = model._meta.db_table
+    shadow_table = '%s_%s' % (db_table, suffix)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(%s) FROM %s' % (quote('id'), quote(db_table)))
+        last_id = cursor.fetchone()[0] or 0
+        cursor.execute('SELECT MAX(%s) FROM %s' % (quote(model.transition_attname),
+                                                    quote(NagiosStateTransition._meta.db_table)))
+        last_id = max(last_id, cursor.fetchone()[0] or 0)
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)", [shadow_table, last_id + 1])
+        elif connection.vendor == 'mysql':
+            cursor.execute('ALTER TABLE %s AUTO_INCREMENT = %d' % (quote(shadow_table), last_id + 1))
+        elif connection.vendor == 'sqlite':
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [shadow_table, last_id])
+
+
+def publish_by_rename(suffix):
+    """
+    Replace the tables with the shadow tables by renaming them. The old tables are dropped.
+    With PostgreSQL this happens in one transaction, with MySQL in one RENAME TABLE statement.
+    Either way readers see the old or the new tables.
+    """
+    old_suffix = 'o%s' % suffix[1:]
+    if connection.vendor == 'mysql':
+        # MySQL can not roll back DDL, but it renames all tables of one statement atomically
+        quote = connection.ops.quote_name
+        renames = []
+        for model in shadow_models():
+            db_table = model._meta.db_table
+            renames.append('%s TO %s' % (quote(db_table), quote('%s_%s' % (db_table, old_suffix))))
+            renames.append('%s TO %s' % (quote('%s_%s' % (db_table, suffix)), quote(db_table)))
+        with connection.cursor() as cursor:
+            cursor.execute('RENAME TABLE %s' % ', '.join(renames))
+        drop_tables(old_suffix)
+        return
+    with connection.schema_editor() as editor:
+        for model in shadow_models():
+            db_table = model._meta.db_table
+            editor.alter_db_table(model, db_table, '%s_%s' % (db_table, old_suffix))
+        for model in shadow_models():
+            db_table = model._meta.db_table
+            editor.alter_db_table(model, '%s_%s' % (db_table, suffix), db_table)
+    drop_tables(old_suffix)
+
+
+def publish_by_copy(suffix):
+    """
+    Replace the content of the tables with the content of the shadow tables in one transaction.
+    SQLite does not update the foreign keys of a renamed table in every version, so we copy there.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in reversed(shadow_models()):
+            cursor.execute('DELETE FROM %s' % quote(model._meta.db_table))
+        for model in shadow_models():
+            columns = ', '.join(quote(field.column) for field in model._meta.concrete_fields)
+            cursor.execute('INSERT INTO %s (%s) SELECT %s FROM %s' % (
+                quote(model._meta.db_table), columns, columns, quote('%s_%s' % (model._meta.db_table, suffix))))
+    drop_tables(suffix)
+
+
+def shadow_sync(load):
+    """
+    Call load() with the models using new, empty shadow tables and publish them when it succeeded.
+    The tables the readers use are not locked while load() runs. They are replaced at the end
+    by renaming the shadow tables, with SQLite by copying them in one short transaction.
+    load() must import everything, the shadow tables replace the complete data.
+    The hosts and services keep their primary keys and their state transitions are recorded, see
+    NagiosStatus.import_rows(). The transitions are written to the table of the readers.
+    """
+    drop_stale_tables()
+    suffix = 's%d' % (time.time() * 1000)
+    with use_tables(suffix), connection.schema_editor() as editor:
+        for model in SHADOW_MODELS:
+            editor.create_model(model)
+    try:
+        for model in SHADOW_MODELS:
+            if issubclass(model, NagiosStatus):
+                continue_ids(model, suffix)
+        t = time.perf_counter()
+        with use_tables(suffix), transaction.atomic():
+            load()
+        log.debug('Loaded the shadow tables *_%s in %.1f seconds' % (suffix, time.perf_counter() - t))
+    except Exception:
+        drop_tables(suffix)
+        raise
+    t = time.perf_counter()
+    if connection.vendor == 'sqlite':
+        publish_by_copy(suffix)
+    else:
+        publish_by_rename(suffix)
+    log.debug('Published the shadow tables *_%s in %.1f seconds' % (suffix, time.perf_counter() - t))
+    # The imports already started new generations, but before the tables were published
+    bump_generation()
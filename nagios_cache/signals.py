@@ -0,0 +1,12 @@
+
+
+from django.dispatch import Signal
+
+# Sent when a phase of an import finished. The sender is the model class that is imported.
+# Arguments: phase (download, parse, convert, write or membership), seconds and queries
+# (the number of database queries, None if they were not counted).
+sync_phase_finished = Signal()
+
+# Sent for the counters of an import. The sender is the model class that is imported.
+# Arguments: name (e.g. bytes_downloaded, created, updated, unchanged, skipped) and value.
+sync_counter = Signal()
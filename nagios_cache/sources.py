@@ -0,0 +1,58 @@
+
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# The source of installations with a single Icinga server (settings.NAGIOS_CACHE_URL)
+DEFAULT_SOURCE = 'default'
+
+_active_source = None
+
+
+def get_sources():
+    """
+    Return an ordered dict name -> {'URL': ..., 'USER': ..., 'PASSWORD': ...} of all Icinga servers.
+    Without settings.NAGIOS_CACHE_SOURCES this is the single source 'default' defined by
+    settings.NAGIOS_CACHE_URL, NAGIOS_CACHE_USER and NAGIOS_CACHE_PASSWORD.
+    """
+    if not settings.NAGIOS_CACHE_SOURCES:
+        return OrderedDict([(DEFAULT_SOURCE, {
+            'URL': settings.NAGIOS_CACHE_URL,
+            'USER': settings.NAGIOS_CACHE_USER,
+            'PASSWORD': settings.NAGIOS_CACHE_PASSWORD,
+        })])
+    return OrderedDict((name, dict({'USER': None, 'PASSWORD': None}, **config))
+                       for name, config in sorted(settings.NAGIOS_CACHE_SOURCES.items()))
+
+
+def get_source():
+    """
+    The name of the source the importers of this process currently work on.
+    """
+    if _active_source is not None:
+        return _active_source
+    return next(iter(get_sources()))
+
+
+def get_source_config():
+    return get_sources()[get_source()]
+
+
+@contextmanager
+def activate(name):
+    """
+    Let the importers of this process work on the source name inside the with block.
+    It is a process wide setting (the downloads run in worker threads), so a process
+    imports one source at a time.
+    """
+    global _active_source
+    if name not in get_sources():
+        raise KeyError('Unknown Nagios source %s' % name)
+    previous = _active_source
+    _active_source = name
+    try:
+        yield
+    finally:
+        _active_source = previous
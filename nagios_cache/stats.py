@@ -0,0 +1,208 @@
+
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection
+
+from nagios_cache.signals import sync_phase_finished, sync_counter
+
+PHASES = ['download', 'parse', 'convert', 'write', 'membership']
+
+
+class QueryCounter(object):
+    """
+    Count the queries of the current database connection inside a with block.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._capture = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        if hasattr(connection, 'execute_wrapper'):
+            self._wrapper = connection.execute_wrapper(self)
+            self._wrapper.__enter__()
+        else:
+            # Django < 2.0 has no execute wrappers, there we count the queries of the debug cursor
+            from django.test.utils import CaptureQueriesContext
+            self._capture = CaptureQueriesContext(connection)
+            self._capture.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._capture is not None:
+            self._capture.__exit__(*exc_info)
+            self.count = len(self._capture)
+        else:
+            self._wrapper.__exit__(*exc_info)
+
+
+def record_phase(sender, name, seconds, queries=None):
+    if sync_phase_finished.has_listeners(sender):
+        sync_phase_finished.send(sender=sender, phase=name, seconds=seconds, queries=queries)
+
+
+def record_count(sender, name, value):
+    if value and sync_counter.has_listeners(sender):
+        sync_counter.send(sender=sender, name=name, value=value)
+
+
+@contextmanager
+def phase(sender, name, count_queries=True):
+    """
+    Time the with block as the phase name of the import of sender and count its queries.
+    Downloads run in worker threads without a database connection, they pass count_queries=False.
+    Without receivers for sync_phase_finished nothing is measured.
+    """
+    if not sync_phase_finished.has_listeners(sender):
+        yield
+        return
+    t = time.perf_counter()
+    if not count_queries:
+        yield
+        record_phase(sender, name, time.perf_counter() - t)
+        return
+    with QueryCounter() as queries:
+        yield
+    record_phase(sender, name, time.perf_counter() - t, queries.count)
+
+
+class SyncStats(object):
+    """
+    Collects the signals of the importers while it is connected:
+
+        with SyncStats() as stats:
+            NagiosHostStatus.import_all(current_time)
+        print(stats.summary())
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.started = None
+        self.duration = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __getstate__(self):
+        # The stats of the worker processes of nagios_sync are pickled, the lock can not be
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __exit__(self, *exc_info):
+        self.disconnect()
+
+    def connect(self):
+        self.started = time.perf_counter()
+        sync_phase_finished.connect(self.on_phase, dispatch_uid=id(self))
+        sync_counter.connect(self.on_counter, dispatch_uid=id(self))
+
+    def disconnect(self):
+        sync_phase_finished.disconnect(dispatch_uid=id(self))
+        sync_counter.disconnect(dispatch_uid=id(self))
+        self.duration = time.perf_counter() - self.started
+
+    def merge(self, other):
+        """
+        Add the numbers of other, e.g. of the syncs of the other entities in nagios_syncd
+        """
+        with self.lock:
+            for key, value in other.seconds.items():
+                self.seconds[key] += value
+            for key, value in other.queries.items():
+                self.queries[key] += value
+            for key, value in other.counters.items():
+                self.counters[key] += value
+            if other.duration is not None:
+                self.duration = (self.duration or 0) + other.duration
+
+    def on_phase(self, sender, phase, seconds, queries, **kwargs):
+        # The downloads of several groups run in threads
+        with self.lock:
+            self.seconds[(sender.__name__, phase)] += seconds
+            self.queries[(sender.__name__, phase)] += queries or 0
+
+    def on_counter(self, sender, name, value, **kwargs):
+        with self.lock:
+            self.counters[(sender.__name__, name)] += value
+
+    def summary(self):
+        """
+        A human readable table of the collected numbers
+        """
+        lines = ['%-20s %-12s %10s %8s' % ('model', 'phase', 'seconds', 'queries')]
+        for model, phase_name in sorted(self.seconds, key=lambda k: (k[0], PHASES.index(k[1]))):
+            lines.append('%-20s %-12s %10.3f %8s' % (model, phase_name, self.seconds[(model, phase_name)],
+                                                      self.queries[(model, phase_name)]))
+        lines.append('')
+        lines.append('%-20s %-20s %10s' % ('model', 'counter', 'value'))
+        for model, name in sorted(self.counters):
+            lines.append('%-20s %-20s %10s' % (model, name, self.counters[(model, name)]))
+        if self.duration is not None:
+            lines.append('')
+            lines.append('Total: %.3f seconds' % self.duration)
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        result = {'duration': self.duration, 'phases': [], 'counters': []}
+        for (model, phase_name), seconds in sorted(self.seconds.items()):
+            result['phases'].append({'model': model, 'phase': phase_name, 'seconds': seconds,
+                                     'queries': self.queries[(model, phase_name)]})
+        for (model, name), value in sorted(self.counters.items()):
+            result['counters'].append({'model': model, 'name': name, 'value': value})
+        return result
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        The numbers in the Prometheus text format, e.g. for the textfile collector of the node exporter
+        """
+        lines = [
+            '# TYPE nagios_cache_sync_phase_seconds gauge',
+            '# TYPE nagios_cache_sync_phase_queries gauge',
+            '# TYPE nagios_cache_sync_rows gauge',
+            '# TYPE nagios_cache_sync_duration_seconds gauge',
+        ]
+        for (model, phase_name), seconds in sorted(self.seconds.items()):
+            labels = 'model="%s",phase="%s"' % (model, phase_name)
+            lines.append('nagios_cache_sync_phase_seconds{%s} %f' % (labels, seconds))
+            lines.append('nagios_cache_sync_phase_queries{%s} %d' % (labels, self.queries[(model, phase_name)]))
+        for (model, name), value in sorted(self.counters.items()):
+            lines.append('nagios_cache_sync_rows{model="%s",name="%s"} %d' % (model, name, value))
+        if self.duration is not None:
+            lines.append('nagios_cache_sync_duration_seconds %f' % self.duration)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Write the numbers to path, in the Prometheus format if it ends with .prom, else as JSON.
+        The file is replaced atomically, so a collector never reads half a file.
+        """
+        content = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
@@ -0,0 +1,994 @@
+
+
+import io
+import json
+import time
+
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+import pytz
+
+from nagios_cache import benchmark, parsers, queries, shadow
+from nagios_cache.admin import NagiosServiceStatusAdmin
+from nagios_cache.apps import config_validation
+from nagios_cache.cache import GENERATION_KEY, get_cache
+from nagios_cache.client import ijson
+from nagios_cache.management.commands import nagios_syncd
+from nagios_cache.models import NagiosHostStatus, NagiosServiceStatus, NagiosHostgroup, NagiosServicegroup
+from nagios_cache.models import NagiosStateTransition, NagiosStatus, NagiosStatusSummary, NagiosSyncState
+from nagios_cache.signals import sync_counter, sync_phase_finished
+from nagios_cache.sources import get_sources
+from nagios_cache.stats import SyncStats
+
+
+def query_plan(queryset):
+    """
+    The SQLite query plan of queryset as one string
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        return ' | '.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def nagios_status(status='OK', **kwargs):
+    """
+    A host or service as status.cgi returns it
+    """
+    values = {
+        'status': status,
+        'last_check': '10-18-2026 12:00:00',
+        'duration': '0d 1h 0m 0s',
+        'attempts': '1/3',
+        'state_type': 'HARD',
+        'is_flapping': False,
+        'in_scheduled_downtime': False,
+        'active_checks_enabled': True,
+        'passive_checks_enabled': False,
+        'notifications_enabled': True,
+        'has_been_acknowledged': False,
+        'action_url': '',
+        'notes_url': '',
+        'status_information': '%s - check output' % status,
+    }
+    values.update(kwargs)
+    return values
+
+
+def nagios_host(host_name, status='UP', **kwargs):
+    return nagios_status(status, host_name=host_name, host_display_name=host_name, **kwargs)
+
+
+def nagios_service(host_name, service_description, status='OK', **kwargs):
+    return nagios_status(status, host_name=host_name, host_display_name=host_name,
+                         service_description=service_description, service_display_name=service_description, **kwargs)
+
+
+def create_host(host_name, current_time, **kwargs):
+    host = NagiosHostStatus.nagios2object(nagios_host(host_name, **kwargs), current_time)
+    host.save()
+    return host
+
+
+def create_service(host, service_description, current_time, **kwargs):
+    service = NagiosServiceStatus.nagios2object(nagios_service(host.host_name, service_description, **kwargs), current_time)
+    service.host = host
+    service.save()
+    return service
+
+
+def count_queries(func, *args, **kwargs):
+    """
+    The number of database queries of func(*args, **kwargs)
+    """
+    with CaptureQueriesContext(connection) as context:
+        func(*args, **kwargs)
+    return len(context.captured_queries)
+
+
+def status_response(data):
+    """
+    A mocked response of status.cgi with data as JSON body
+    """
+    response = mock.Mock(status_code=200, headers={}, content=json.dumps(data).encode('utf-8'))
+    response.json.return_value = data
+    return response
+
+
+class ParserTest(TestCase):
+
+    def test_us_datetime(self):
+        self.assertEqual(parsers.parse_datetime('10-18-2016 12:01:02'), datetime(2016, 10, 18, 12, 1, 2, tzinfo=pytz.utc))
+
+    def test_iso_datetime(self):
+        self.assertEqual(parsers.parse_datetime('2016-10-18 12:01:02'), datetime(2016, 10, 18, 12, 1, 2, tzinfo=pytz.utc))
+
+    def test_day_first_datetime(self):
+        # Matches the US format, but has no valid month. parsedatetime decides.
+        parsed, _ = parsers._calendar.parse('18-10-2016 12:01:02')
+        self.assertEqual(parsers.parse_datetime('18-10-2016 12:01:02'), pytz.utc.localize(datetime(*parsed[:6])))
+
+    def test_empty_datetime(self):
+        parsed = parsers.parse_datetime('')
+        self.assertIsInstance(parsed, datetime)
+        self.assertEqual(parsed.tzinfo, pytz.utc)
+
+    def test_duration(self):
+        now = timezone.now()
+        self.assertEqual(parsers.parse_duration('1d 2h 3m 4s', now), timedelta(days=1, hours=2, minutes=3, seconds=4))
+        self.assertEqual(parsers.parse_duration('0d 0h 0m 5s+', now), timedelta(seconds=5))
+
+
+class ConversionTest(TestCase):
+
+    def test_matches_constructor(self):
+        now = timezone.now()
+        service = NagiosServiceStatus.nagios2object(nagios_service('host', 'ping', status='CRITICAL', attempts='2/3',
+                                                                   state_type='SOFT', notes_url=None), now)
+        expected = NagiosServiceStatus(
+            last_database_update=now, source='default', action_url='', active_checks_enabled=True, attempts=2,
+            attempts_of=3, duration=timedelta(hours=1), has_been_acknowledged=False, host_display_name='host',
+            host_name='host', in_scheduled_downtime=False, is_flapping=False,
+            last_check=datetime(2026, 10, 18, 12, tzinfo=pytz.utc), notes_url=None, notifications_enabled=True,
+            passive_checks_enabled=False, state_type=NagiosStatus.STATE_TYPE_SOFT, status=NagiosStatus.STATUS_CRITICAL,
+            status_information='CRITICAL - check output', sync_hash='', service_description='ping',
+            service_display_name='ping')
+        for field in NagiosServiceStatus._meta.concrete_fields:
+            self.assertEqual(getattr(service, field.attname), getattr(expected, field.attname), field.attname)
+        self.assertTrue(service._state.adding)
+        self.assertIsNone(service._state.db)
+
+    def test_saved(self):
+        now = timezone.now()
+        host = NagiosHostStatus.nagios2object(nagios_host('host', status='DOWN'), now)
+        host.save()
+        self.assertEqual(NagiosHostStatus.objects.get(pk=host.pk).status, NagiosStatus.STATUS_DOWN)
+        self.assertFalse(host._state.adding)
+
+    def test_unknown_status(self):
+        with self.assertRaises(Exception):
+            NagiosHostStatus.nagios2values(nagios_host('host', status='BROKEN'), timezone.now())
+
+
+class CleanOldTest(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        old = now - timedelta(days=3)
+        self.old_hosts = [create_host('old%s' % i, old) for i in range(5)]
+        self.host = create_host('new', now)
+        self.old_services = [create_service(host, 'ping', old) for host in self.old_hosts]
+        self.service = create_service(self.host, 'ping', now)
+        self.hostgroup = NagiosHostgroup.objects.create(name='hostgroup', last_database_update=now)
+        self.hostgroup.hosts.add(self.host, *self.old_hosts)
+        self.servicegroup = NagiosServicegroup.objects.create(name='servicegroup', last_database_update=now)
+        self.servicegroup.services.add(self.service, *self.old_services)
+
+    def test_batches(self):
+        batches = []
+        removed = NagiosHostStatus.clean_old(days=1, batch_size=2, report=lambda batch, count: batches.append(count))
+        self.assertEqual(removed, 5)
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertEqual(list(NagiosHostStatus.objects.all()), [self.host])
+
+    def test_cascade(self):
+        # The services of the removed hosts and the group memberships of both are deleted with raw DELETEs
+        NagiosHostStatus.clean_old(days=1, batch_size=2)
+        self.assertEqual(list(NagiosServiceStatus.objects.all()), [self.service])
+        self.assertEqual(list(self.hostgroup.hosts.all()), [self.host])
+        self.assertEqual(list(self.servicegroup.services.all()), [self.service])
+        self.assertEqual(NagiosHostgroup.objects.count(), 1)
+
+    def test_without_batches(self):
+        self.assertEqual(NagiosServiceStatus.clean_old(days=1, batch_size=0), 5)
+        self.assertEqual(list(self.servicegroup.services.all()), [self.service])
+        self.assertEqual(NagiosHostStatus.objects.count(), 6)
+
+
+class HistoryTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        old = self.now - timedelta(days=3)
+        self.host = create_host('old', old)
+        self.service = create_service(self.host, 'ping', old)
+        for days in [100, 2]:
+            for service in [None, self.service]:
+                NagiosStateTransition.objects.create(host=self.host, service=service, time=self.now - timedelta(days=days),
+                                                     status=NagiosStatus.STATUS_UP, state_type=NagiosStatus.STATE_TYPE_HARD)
+
+    def test_clean_old(self):
+        self.assertEqual(NagiosHostStatus.clean_old(days=1, batch_size=10), 1)
+        self.assertEqual(NagiosServiceStatus.objects.count(), 0)
+        self.assertEqual(NagiosStateTransition.objects.count(), 4)
+
+    def test_clean_old_without_batches(self):
+        self.assertEqual(NagiosHostStatus.clean_old(days=1, batch_size=0), 1)
+        self.assertEqual(NagiosStateTransition.objects.count(), 4)
+
+    @override_settings(NAGIOS_CACHE_BATCH_SIZE=2)
+    def test_record_per_batch(self):
+        rows = [nagios_host('host%s' % i, status='DOWN') for i in range(5)]
+        with mock.patch.object(NagiosStateTransition, 'record', wraps=NagiosStateTransition.record) as record:
+            NagiosHostStatus.import_rows(rows, self.now)
+        self.assertEqual([len(call[0][1]) for call in record.call_args_list], [2, 2, 1])
+        transitions = NagiosStateTransition.objects.filter(status=NagiosStatus.STATUS_DOWN)
+        self.assertEqual(sorted(transitions.values_list('host__host_name', flat=True)), ['host%s' % i for i in range(5)])
+
+    def test_prune(self):
+        NagiosHostStatus.clean_old(days=1)
+        self.assertEqual(NagiosStateTransition.prune(90, batch_size=1), 2)
+        self.assertEqual(list(NagiosStateTransition.objects.values_list('time', flat=True)), [self.now - timedelta(days=2)] * 2)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The query plans are checked with SQLite')
+class QueryPlanTest(TestCase):
+    """
+    The lookups of the importers and of clean_old must use an index instead of scanning the tables
+    """
+
+    def assertUsesIndex(self, queryset):
+        plan = query_plan(queryset)
+        self.assertRegex(plan, r'^SEARCH \S+ USING (COVERING )?INDEX', plan)
+
+    def test_host_pk_index(self):
+        self.assertUsesIndex(NagiosHostStatus.source_objects().values_list('host_name', 'id'))
+
+    def test_service_pk_index(self):
+        self.assertUsesIndex(NagiosServiceStatus.source_objects().values_list('host_name', 'service_description', 'id'))
+
+    def test_import_rows_preload(self):
+        fields = ['host_name', 'service_description', 'id', 'last_database_update', 'sync_hash', 'status',
+                  'has_been_acknowledged', 'in_scheduled_downtime', 'state_type']
+        self.assertUsesIndex(NagiosServiceStatus.source_objects().values_list(*fields))
+
+    def test_clean_old(self):
+        for model in [NagiosHostStatus, NagiosServiceStatus, NagiosHostgroup, NagiosServicegroup]:
+            query = model.objects.filter(last_database_update__lt=timezone.now() - timedelta(days=1))
+            self.assertUsesIndex(query.order_by('last_database_update', 'pk').values_list('pk', flat=True)[:1000])
+
+    def test_group_lookup(self):
+        for model in [NagiosHostgroup, NagiosServicegroup]:
+            self.assertUsesIndex(model.source_objects().filter(name__in=['a', 'b']))
+
+
+class ConfigValidationTest(TestCase):
+
+    def check_ids(self):
+        return [message.id for message in config_validation(None)]
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache(self):
+        self.assertIn('nagios_cache.W004', self.check_ids())
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                               'nagios': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                          'LOCATION': '/tmp/nagios_cache'}},
+                       NAGIOS_CACHE_QUERY_CACHE='nagios')
+    def test_shared_cache(self):
+        self.assertNotIn('nagios_cache.W004', self.check_ids())
+
+
+class ShadowSyncTest(TransactionTestCase):
+    """
+    shadow_sync() creates and drops tables, so it can not run inside the transaction of a TestCase
+    """
+
+    def setUp(self):
+        self.host = create_host('old', timezone.now())
+
+    def shadow_tables(self):
+        return [name for name in connection.introspection.table_names() if shadow.re.search(r'_[so]\d+$', name)]
+
+    def load(self):
+        host = create_host('new', timezone.now())
+        create_service(host, 'ping', timezone.now())
+
+    def test_publish_by_copy(self):
+        shadow.shadow_sync(self.load)
+        self.assertEqual(list(NagiosHostStatus.objects.values_list('host_name', flat=True)), ['new'])
+        self.assertEqual(NagiosServiceStatus.objects.get().host.host_name, 'new')
+        self.assertEqual(self.shadow_tables(), [])
+
+    def test_publish_by_rename(self):
+        with mock.patch.object(shadow, 'publish_by_copy', shadow.publish_by_rename):
+            shadow.shadow_sync(self.load)
+        self.assertEqual(list(NagiosHostStatus.objects.values_list('host_name', flat=True)), ['new'])
+        self.assertEqual(NagiosServiceStatus.objects.get().host.host_name, 'new')
+        self.assertEqual(self.shadow_tables(), [])
+
+    def test_failed_load(self):
+        def load():
+            self.load()
+            raise ValueError('download failed')
+        with self.assertRaises(ValueError):
+            shadow.shadow_sync(load)
+        self.assertEqual(list(NagiosHostStatus.objects.all()), [self.host])
+        self.assertEqual(self.shadow_tables(), [])
+
+    def test_history(self):
+        now = timezone.now()
+        service = create_service(self.host, 'ping', now)
+        removed = create_host('removed', now)
+        NagiosStateTransition.objects.create(host=removed, time=now, status=NagiosStatus.STATUS_UP,
+                                             state_type=NagiosStatus.STATE_TYPE_HARD)
+
+        def load():
+            NagiosHostStatus.import_rows([nagios_host('old', status='DOWN'), nagios_host('new')], now)
+            NagiosServiceStatus.import_rows([nagios_service('old', 'ping'), nagios_service('new', 'ping')], now,
+                                            prepare=NagiosServiceStatus.host_lookup())
+        shadow.shadow_sync(load)
+        old = NagiosHostStatus.objects.get(host_name='old')
+        new = NagiosHostStatus.objects.get(host_name='new')
+        self.assertEqual(old.pk, self.host.pk)
+        self.assertGreater(new.pk, removed.pk)
+        self.assertEqual(NagiosServiceStatus.objects.get(host=old).pk, service.pk)
+        self.assertEqual(list(old.transitions.filter(service=None).values_list('previous_status', 'status')),
+                         [(NagiosStatus.STATUS_UP, NagiosStatus.STATUS_DOWN)])
+        self.assertEqual(list(new.transitions.order_by('pk').values_list('service__service_description', 'previous_status')),
+                         [(None, None), ('ping', None)])
+        # The service of the old host did not change
+        self.assertFalse(old.transitions.exclude(service=None).exists())
+
+    def test_drop_stale_tables(self):
+        now = int(time.time() * 1000)
+        stale = 's%d' % (now - (shadow.STALE_TABLE_SECONDS + 60) * 1000)
+        loading = 's%d' % now
+        for suffix in [stale, loading]:
+            with shadow.use_tables(suffix), connection.schema_editor() as editor:
+                for model in shadow.SHADOW_MODELS:
+                    editor.create_model(model)
+        shadow.drop_stale_tables()
+        tables = self.shadow_tables()
+        self.assertFalse([name for name in tables if name.endswith(stale)])
+        self.assertIn('%s_%s' % (NagiosHostStatus._meta.db_table, loading), tables)
+        shadow.drop_tables(loading)
+
+
+@override_settings(NAGIOS_CACHE_STREAMING=False, NAGIOS_CACHE_SKIP_UNCHANGED=True)
+class SkipUnchangedTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+
+    def import_services(self, current_time):
+        self.session.get.return_value = status_response({'status': {'service_status': [
+            nagios_service('host', 'ping'), nagios_service('host', 'http')]}})
+        return NagiosServiceStatus.import_url(NagiosServiceStatus.suffix, current_time,
+                                              prepare=NagiosServiceStatus.host_lookup())
+
+    def service_state(self):
+        return NagiosSyncState.objects.get(name=NagiosServiceStatus.sync_state_name(NagiosServiceStatus.suffix))
+
+    def test_not_modified(self):
+        create_host('host', self.now)
+        self.assertEqual(self.import_services(self.now), (2, 0))
+        later = self.now + timedelta(minutes=1)
+        self.assertEqual(self.import_services(later), (0, 2))
+        self.assertEqual(set(NagiosServiceStatus.objects.values_list('last_database_update', flat=True)), {later})
+        self.assertEqual(self.service_state().last_sync, later)
+
+    def test_skipped_rows(self):
+        self.assertEqual(self.import_services(self.now), (0, 0))
+        self.assertEqual(self.service_state().body_hash, '')
+        create_host('host', self.now)
+        self.assertEqual(self.import_services(self.now + timedelta(minutes=1)), (2, 0))
+        self.assertNotEqual(self.service_state().body_hash, '')
+
+    def test_missing_members(self):
+        host = create_host('host', self.now)
+        create_service(host, 'ping', self.now)
+        NagiosServicegroup.objects.create(name='web', last_database_update=self.now)
+        self.session.get.return_value = status_response({'status': {'service_status': [
+            nagios_service('host', 'ping'), nagios_service('host', 'http')]}})
+        NagiosServicegroup.import_single(self.now, 'web')
+        state = NagiosSyncState.objects.get(name=NagiosServicegroup.sync_state_name(NagiosServicegroup.suffix_single % 'web'))
+        self.assertEqual(state.body_hash, '')
+        create_service(host, 'http', self.now)
+        NagiosServicegroup.import_single(self.now, 'web')
+        self.assertEqual(NagiosServicegroup.objects.get().services.count(), 2)
+
+    def test_clean_old(self):
+        create_host('host', self.now - timedelta(days=3))
+        self.import_services(self.now - timedelta(days=3))
+        hostgroup_state = NagiosSyncState.objects.create(name=NagiosHostgroup.sync_state_name(NagiosHostgroup.suffix),
+                                                         body_hash='0' * 40)
+        self.assertNotEqual(self.service_state().body_hash, '')
+        self.assertEqual(NagiosHostStatus.clean_old(days=1), 1)
+        self.assertEqual(self.service_state().body_hash, '')
+        hostgroup_state.refresh_from_db()
+        self.assertEqual(hostgroup_state.body_hash, '')
+
+
+class FingerprintTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.later = self.now + timedelta(minutes=1)
+        self.rows = [nagios_host('host%s' % i) for i in range(3)]
+        NagiosHostStatus.import_rows(self.rows, self.now)
+
+    def test_unchanged(self):
+        # Only the duration grew, it is no part of the fingerprint
+        rows = [dict(row, duration='0d 1h 1m 0s') for row in self.rows]
+        with CaptureQueriesContext(connection) as context:
+            written, unchanged, newest_check, skipped = NagiosHostStatus.import_rows(rows, self.later)
+        self.assertEqual((written, unchanged), (0, 3))
+        # The preloads and one UPDATE of last_database_update and duration
+        statements = [query['sql'].split(None, 1)[0].upper() for query in context.captured_queries]
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.assertNotIn('INSERT', statements)
+        self.assertEqual(set(NagiosHostStatus.objects.values_list('last_database_update', 'duration')),
+                         {(self.later, timedelta(hours=1, minutes=1))})
+
+    def test_changed(self):
+        rows = list(self.rows)
+        rows[1] = dict(rows[1], status_information='UP - other output')
+        written, unchanged, newest_check, skipped = NagiosHostStatus.import_rows(rows, self.later)
+        self.assertEqual((written, unchanged), (1, 2))
+        self.assertEqual(NagiosHostStatus.objects.get(host_name='host1').status_information, 'UP - other output')
+        self.assertEqual(NagiosHostStatus.objects.filter(last_database_update=self.later).count(), 3)
+
+
+@override_settings(NAGIOS_CACHE_STREAMING=False)
+class IncrementalImportTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+        self.import_hosts([nagios_host('old', last_check='10-18-2026 11:00:00'),
+                           nagios_host('down', last_check='10-18-2026 11:00:00'),
+                           nagios_host('new', last_check='10-18-2026 12:00:00')])
+
+    def import_hosts(self, hosts):
+        self.session.get.return_value = status_response({'status': {'host_status': hosts}})
+        return NagiosHostStatus.import_url(NagiosHostStatus.suffix, self.now, incremental=True)
+
+    def state(self):
+        return NagiosSyncState.objects.get(name=NagiosHostStatus.sync_state_name(NagiosHostStatus.suffix))
+
+    def test_watermark(self):
+        self.assertEqual(self.state().last_check, datetime(2026, 10, 18, 12, tzinfo=pytz.utc))
+        hosts = [nagios_host('old', last_check='10-18-2026 11:00:00', status_information='UP - other output'),
+                 nagios_host('down', status='DOWN', last_check='10-18-2026 11:00:00'),
+                 nagios_host('new', last_check='10-18-2026 12:05:00', status_information='UP - other output')]
+        with mock.patch.object(NagiosHostStatus, 'fingerprint', wraps=NagiosHostStatus.fingerprint) as fingerprint:
+            self.assertEqual(self.import_hosts(hosts), (2, 1))
+        # The row checked before the watermark with the same status is unchanged without a fingerprint
+        self.assertEqual(fingerprint.call_count, 2)
+        self.assertEqual(NagiosHostStatus.objects.get(host_name='old').status_information, 'UP - check output')
+        self.assertEqual(NagiosHostStatus.objects.get(host_name='down').status, NagiosStatus.STATUS_DOWN)
+        self.assertEqual(NagiosHostStatus.objects.get(host_name='new').status_information, 'UP - other output')
+        self.assertEqual(self.state().last_check, datetime(2026, 10, 18, 12, 5, tzinfo=pytz.utc))
+        # An incremental import is no complete import of the response
+        self.assertEqual(self.state().body_hash, '')
+
+
+@override_settings(NAGIOS_CACHE_STREAMING=False)
+class SyncStatsTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+
+    def import_hosts(self, hosts):
+        self.session.get.return_value = status_response({'status': {'host_status': hosts}})
+        with SyncStats() as stats:
+            NagiosHostStatus.import_all(self.now)
+        return stats
+
+    def test_counters(self):
+        hosts = [nagios_host('host%s' % i) for i in range(3)]
+        stats = self.import_hosts(hosts)
+        self.assertEqual(stats.counters[('NagiosHostStatus', 'created')], 3)
+        self.assertEqual(stats.counters[('NagiosHostStatus', 'transitions')], 3)
+        self.assertEqual(stats.counters[('NagiosHostStatus', 'bytes_downloaded')],
+                         len(self.session.get.return_value.content))
+        hosts[0] = nagios_host('host0', status='DOWN')
+        stats = self.import_hosts(hosts)
+        self.assertEqual((stats.counters[('NagiosHostStatus', 'updated')], stats.counters[('NagiosHostStatus', 'unchanged')]), (1, 2))
+        self.assertNotIn(('NagiosHostStatus', 'created'), stats.counters)
+        stats = self.import_hosts(hosts)
+        self.assertEqual(stats.counters[('NagiosHostStatus', 'responses_not_modified')], 1)
+
+    def test_phases(self):
+        stats = self.import_hosts([nagios_host('host')])
+        self.assertEqual(set(phase for model, phase in stats.seconds), {'download', 'parse', 'convert', 'write'})
+        # The downloads are not counted, they run without the database
+        self.assertEqual(stats.queries[('NagiosHostStatus', 'download')], 0)
+        self.assertGreater(stats.queries[('NagiosHostStatus', 'write')], 0)
+        self.assertIsNotNone(stats.duration)
+        self.assertIn('nagios_cache_sync_rows{model="NagiosHostStatus",name="created"} 1', stats.to_prometheus())
+
+    def test_disconnected(self):
+        self.import_hosts([nagios_host('host')])
+        self.assertFalse(sync_counter.has_listeners(NagiosHostStatus))
+        self.assertFalse(sync_phase_finished.has_listeners(NagiosHostStatus))
+
+    def test_merge(self):
+        merged = SyncStats()
+        merged.merge(self.import_hosts([nagios_host('host0')]))
+        merged.merge(self.import_hosts([nagios_host('host1')]))
+        self.assertEqual(merged.counters[('NagiosHostStatus', 'created')], 2)
+
+
+class BenchmarkTest(TestCase):
+
+    @override_settings(NAGIOS_CACHE_SOURCES={'dc1': {'URL': 'https://icinga.example.org/cgi-bin/icinga/status.cgi'}})
+    def test_syncs_the_fake_server(self):
+        server = mock.MagicMock()
+        server.__enter__.return_value.url.side_effect = lambda revision: 'http://127.0.0.1:1/%s/status.cgi' % revision
+        synced = []
+        with mock.patch.object(benchmark, 'FakeStatusCGI', return_value=server), \
+                mock.patch('django.core.management.call_command', side_effect=lambda *args, **kwargs: synced.append(get_sources())):
+            benchmark.run_benchmark(runs=2)
+        self.assertEqual([list(sources.items()) for sources in synced], [
+            [('default', {'URL': 'http://127.0.0.1:1/%s/status.cgi' % revision, 'USER': None, 'PASSWORD': None})]
+            for revision in range(2)])
+
+
+class SyncdTest(TestCase):
+
+    def sync(self):
+        command = nagios_syncd.Command()
+        with mock.patch.object(command, 'sync_source') as sync_source:
+            command.sync('hosts', NagiosHostStatus, {'incremental': False})
+        self.assertEqual(sync_source.call_count, 1)
+
+    def test_keeps_the_connection(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'close') as close:
+            self.sync()
+        self.assertFalse(close.called)
+
+    def test_closes_a_broken_connection(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            self.sync()
+        self.assertTrue(close.called)
+
+
+class StatusSummaryTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.host = create_host('host', self.now)
+        self.ping = create_service(self.host, 'ping', self.now, status='CRITICAL', has_been_acknowledged=True)
+        self.http = create_service(self.host, 'http', self.now)
+        self.other = create_host('other', self.now)
+        self.hostgroup = NagiosHostgroup.objects.create(name='hostgroup', last_database_update=self.now)
+        self.hostgroup.hosts.add(self.host, self.other)
+        self.servicegroup = NagiosServicegroup.objects.create(name='servicegroup', last_database_update=self.now)
+        self.servicegroup.services.add(self.ping)
+        NagiosStatusSummary.rebuild(self.now)
+
+    def summary(self, kind, name):
+        return NagiosStatusSummary.objects.get(kind=kind, name=name)
+
+    def test_counts(self):
+        host = self.summary(NagiosStatusSummary.KIND_HOST, 'host')
+        self.assertEqual((host.total, host.ok, host.critical, host.acknowledged, host.hard), (2, 1, 1, 1, 2))
+        self.assertEqual(self.summary(NagiosStatusSummary.KIND_HOST, 'other').total, 0)
+        self.assertEqual(self.summary(NagiosStatusSummary.KIND_HOSTGROUP, 'hostgroup').total, 2)
+        servicegroup = self.summary(NagiosStatusSummary.KIND_SERVICEGROUP, 'servicegroup')
+        self.assertEqual((servicegroup.total, servicegroup.critical), (1, 1))
+
+    def test_unchanged(self):
+        later = self.now + timedelta(minutes=1)
+        with self.assertNumQueries(7):
+            # The stored rows and per kind the counts and the names, nothing is written
+            NagiosStatusSummary.rebuild(later)
+        self.assertFalse(NagiosStatusSummary.objects.filter(last_database_update=later).exists())
+
+    def test_changed(self):
+        later = self.now + timedelta(minutes=1)
+        ids = dict(NagiosStatusSummary.objects.values_list('name', 'id'))
+        NagiosServiceStatus.objects.filter(pk=self.ping.pk).update(status=NagiosStatus.STATUS_OK)
+        self.other.delete()
+        NagiosStatusSummary.rebuild(later)
+        self.assertEqual(sorted(NagiosStatusSummary.objects.filter(last_database_update=later).values_list('name', flat=True)),
+                         ['host', 'hostgroup', 'servicegroup'])
+        self.assertEqual(self.summary(NagiosStatusSummary.KIND_HOST, 'host').ok, 2)
+        self.assertEqual(dict(NagiosStatusSummary.objects.values_list('name', 'id')),
+                         dict((name, pk) for name, pk in ids.items() if name != 'other'))
+
+
+@override_settings(NAGIOS_CACHE_STREAMING=False, NAGIOS_CACHE_FETCH_CONCURRENCY=1)
+class SyncSummaryTest(TestCase):
+    SERVICES = {'web1': {'http': 'CRITICAL', 'ping': 'OK'}, 'web2': {'http': 'OK', 'ping': 'WARNING'}}
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.session.get.side_effect = self.status_cgi
+        self.addCleanup(patcher.stop)
+
+    def status_cgi(self, url, **kwargs):
+        suffix = url.split('?', 1)[1]
+        if suffix == NagiosHostStatus.suffix:
+            return status_response({'status': {'host_status': [nagios_host(host_name) for host_name in sorted(self.SERVICES)]}})
+        if suffix == NagiosHostgroup.suffix:
+            return status_response({'status': {'hostgroup_overview': [
+                {'hostgroup_name': 'web', 'members': [{'host_name': host_name} for host_name in sorted(self.SERVICES)]}]}})
+        if suffix == NagiosServicegroup.suffix:
+            return status_response({'status': {'servicegroup_overview': [{'servicegroup_name': 'http'}]}})
+        services = [nagios_service(host_name, service, status=status)
+                    for host_name, statuses in sorted(self.SERVICES.items()) for service, status in sorted(statuses.items())]
+        if suffix == NagiosServicegroup.suffix_single % 'http':
+            services = [service for service in services if service['service_description'] == 'http']
+        return status_response({'status': {'service_status': services}})
+
+    def counts(self):
+        return dict(((summary.kind, summary.name), (summary.total, summary.ok, summary.warning, summary.critical))
+                    for summary in NagiosStatusSummary.objects.all())
+
+    def test_sync(self):
+        call_command('nagios_sync', stdout=io.StringIO())
+        self.assertEqual(self.counts(), {
+            (NagiosStatusSummary.KIND_HOST, 'web1'): (2, 1, 0, 1),
+            (NagiosStatusSummary.KIND_HOST, 'web2'): (2, 1, 1, 0),
+            (NagiosStatusSummary.KIND_HOSTGROUP, 'web'): (4, 2, 1, 1),
+            (NagiosStatusSummary.KIND_SERVICEGROUP, 'http'): (2, 1, 0, 1),
+        })
+        self.SERVICES = {'web1': {'http': 'OK', 'ping': 'OK'}, 'web2': {'http': 'OK', 'ping': 'WARNING'}}
+        call_command('nagios_sync', stdout=io.StringIO())
+        self.assertEqual(self.counts()[NagiosStatusSummary.KIND_HOSTGROUP, 'web'], (4, 3, 1, 0))
+        self.assertEqual(self.counts()[NagiosStatusSummary.KIND_SERVICEGROUP, 'http'], (2, 2, 0, 0))
+
+
+class HostgroupServicesTest(TestCase):
+    GROUPS = {'all': ['a', 'b', 'c'], 'web': ['a', 'b'], 'db': ['c', 'd']}
+
+    def setUp(self):
+        self.now = timezone.now()
+        for host_name in 'abcde':
+            create_host(host_name, self.now)
+        for name in self.GROUPS:
+            NagiosHostgroup.objects.create(name=name, last_database_update=self.now)
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.session.get.side_effect = self.status_cgi
+        self.addCleanup(patcher.stop)
+        self.requested = []
+
+    def status_cgi(self, url, **kwargs):
+        suffix = url.split('?', 1)[1]
+        self.requested.append(suffix)
+        for name, host_names in self.GROUPS.items():
+            if suffix == NagiosHostgroup.suffix_single % name:
+                return status_response({'status': {'hostgroup_overview': [
+                    {'members': [{'host_name': host_name} for host_name in host_names]}]}})
+            if suffix == NagiosHostgroup.suffix_services % name:
+                return status_response({'status': {'service_status': [
+                    nagios_service(host_name, 'ping') for host_name in host_names]}})
+        return status_response({'status': {'service_status': [nagios_service(host_name, 'ping') for host_name in 'abcde']}})
+
+    def test_covering_hostgroups(self):
+        NagiosHostgroup.import_services(self.now, ['web', 'all', 'db'])
+        self.assertEqual([suffix for suffix in self.requested if 'style=detail' in suffix],
+                         [NagiosHostgroup.suffix_services % name for name in ['all', 'db']])
+        self.assertEqual(sorted(NagiosServiceStatus.objects.values_list('host_name', flat=True)), list('abcd'))
+        self.assertEqual(sorted(NagiosHostgroup.objects.get(name='db').hosts.values_list('host_name', flat=True)), ['c', 'd'])
+
+    @override_settings(NAGIOS_CACHE_HOSTGROUP_SERVICES_LIMIT=1)
+    def test_limit(self):
+        NagiosHostgroup.import_services(self.now, ['web', 'db'])
+        self.assertEqual(self.requested[-1], NagiosServiceStatus.suffix)
+        self.assertEqual(sorted(NagiosServiceStatus.objects.values_list('host_name', flat=True)), list('abcd'))
+
+
+class HostgroupImportTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+        for i in range(50):
+            create_host('host%s' % i, self.now)
+        self.through = NagiosHostgroup.hosts.through
+
+    def import_hostgroups(self, groups):
+        self.session.get.return_value = status_response({'status': {'hostgroup_overview': [
+            {'hostgroup_name': name, 'members': [{'host_name': host_name} for host_name in host_names]}
+            for name, host_names in sorted(groups.items())]}})
+        return count_queries(NagiosHostgroup.import_all, self.now)
+
+    def members(self):
+        return dict((name, sorted(NagiosHostgroup.objects.get(name=name).hosts.values_list('host_name', flat=True)))
+                    for name in NagiosHostgroup.objects.values_list('name', flat=True))
+
+    def test_diff(self):
+        self.import_hostgroups({'web': ['host0', 'host1'], 'db': ['host2']})
+        kept = self.through.objects.get(nagioshoststatus__host_name='host0').pk
+        self.import_hostgroups({'web': ['host0', 'host3'], 'db': ['host2']})
+        self.assertEqual(self.members(), {'web': ['host0', 'host3'], 'db': ['host2']})
+        # The unchanged pairs are not deleted and inserted again
+        self.assertEqual(self.through.objects.get(nagioshoststatus__host_name='host0').pk, kept)
+
+    def test_queries(self):
+        # One DELETE of the removed and one INSERT of the added members, whatever their number
+        self.import_hostgroups({'web': ['host0']})
+        small = self.import_hostgroups({'web': ['host1']})
+        self.import_hostgroups({'web': ['host0']})
+        self.assertEqual(self.import_hostgroups({'web': ['host%s' % i for i in range(1, 50)]}), small)
+        self.assertEqual(len(self.members()['web']), 49)
+
+
+@override_settings(NAGIOS_CACHE_FETCH_CONCURRENCY=1)
+class ServicegroupImportTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.session.get.side_effect = self.status_cgi
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+        host = create_host('host', self.now)
+        for i in range(50):
+            create_service(host, 'service%s' % i, self.now)
+        self.groups = {}
+
+    def status_cgi(self, url, **kwargs):
+        suffix = url.split('?', 1)[1]
+        if suffix == NagiosServicegroup.suffix:
+            return status_response({'status': {'servicegroup_overview': [
+                {'servicegroup_name': name} for name in sorted(self.groups)]}})
+        for name, services in self.groups.items():
+            if suffix == NagiosServicegroup.suffix_single % name:
+                return status_response({'status': {'service_status': [
+                    nagios_service('host', service) for service in services]}})
+
+    def import_servicegroups(self, groups):
+        self.groups = groups
+        return count_queries(NagiosServicegroup.import_all, self.now)
+
+    def members(self):
+        return dict((name, sorted(NagiosServicegroup.objects.get(name=name).services.values_list('service_description', flat=True)))
+                    for name in NagiosServicegroup.objects.values_list('name', flat=True))
+
+    def test_diff(self):
+        self.import_servicegroups({'web': ['service0', 'service1'], 'db': ['service2']})
+        with mock.patch.object(NagiosServicegroup, 'sync_members', wraps=NagiosServicegroup.sync_members) as sync_members:
+            self.import_servicegroups({'web': ['service0', 'service3'], 'db': ['service2']})
+        self.assertEqual(self.members(), {'web': ['service0', 'service3'], 'db': ['service2']})
+        # The detail response of db did not change, so its members are not synced
+        self.assertEqual(list(sync_members.call_args[0][1]), [NagiosServicegroup.objects.get(name='web').pk])
+
+    def test_queries(self):
+        # The services are looked up in one preloaded index, not one query per member
+        self.import_servicegroups({'web': ['service0']})
+        small = self.import_servicegroups({'web': ['service1']})
+        self.import_servicegroups({'web': ['service0']})
+        self.assertEqual(self.import_servicegroups({'web': ['service%s' % i for i in range(1, 50)]}), small)
+        self.assertEqual(len(self.members()['web']), 49)
+
+
+class AdminTest(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        host = create_host('host', now)
+        create_service(host, 'ping', now, status='CRITICAL', status_information='PING CRITICAL - Packet loss = 100%')
+        create_service(host, 'http', now)
+        self.admin = NagiosServiceStatusAdmin(NagiosServiceStatus, admin.site)
+        self.request = RequestFactory().get('/')
+
+    def search(self, term):
+        queryset, use_distinct = self.admin.get_search_results(self.request, NagiosServiceStatus.objects.all(), term)
+        return sorted(queryset.values_list('service_description', flat=True))
+
+    def test_search(self):
+        self.assertEqual(self.search('ping'), ['ping'])
+        self.assertEqual(self.search('loss'), [])
+
+    @override_settings(NAGIOS_CACHE_ADMIN_SEARCH_STATUS_INFORMATION=True)
+    def test_search_status_information(self):
+        self.assertEqual(self.search('loss'), ['ping'])
+
+
+class AdminChangelistTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.now = timezone.now()
+        user = User.objects.create_superuser('admin', 'admin@example.org', 'password')
+        self.client.force_login(user)
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:nagios_cache_nagiosservicestatus_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def create_services(self, count):
+        for i in range(NagiosServiceStatus.objects.count(), NagiosServiceStatus.objects.count() + count):
+            host = create_host('host%s' % i, self.now)
+            create_service(host, 'service%s' % i, self.now)
+
+    def test_queries(self):
+        self.create_services(2)
+        few = self.changelist()
+        get_cache().clear()
+        self.create_services(20)
+        # The hosts are joined, not loaded per row
+        self.assertEqual(self.changelist(), few)
+
+    def test_cached_counts(self):
+        self.create_services(2)
+        first = self.changelist(status=NagiosStatus.STATUS_OK)
+        # The number of rows and the numbers per status come from the cache
+        self.assertEqual(self.changelist(status=NagiosStatus.STATUS_OK), first - 2)
+
+
+@override_settings(ROOT_URLCONF='nagios_cache.urls')
+class ApiTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        now = timezone.now()
+        self.hosts = [create_host('host%s' % i, now, status='DOWN' if i == 3 else 'UP') for i in range(5)]
+        self.ping = create_service(self.hosts[0], 'ping', now, status='CRITICAL')
+        create_service(self.hosts[1], 'ping', now)
+        hostgroup = NagiosHostgroup.objects.create(name='web', last_database_update=now)
+        hostgroup.hosts.add(self.hosts[1], self.hosts[3])
+        servicegroup = NagiosServicegroup.objects.create(name='ping', last_database_update=now)
+        servicegroup.services.add(self.ping)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content).decode('utf-8'))
+
+    def names(self, url, **params):
+        return [row['host_name'] for row in self.get(reverse(url), **params)['results']]
+
+    def test_pages(self):
+        url = reverse('nagios_cache_hosts') + '?limit=2'
+        pages = []
+        while url:
+            page = self.get(url)
+            pages.append([row['host_name'] for row in page['results']])
+            url = page['next']
+        self.assertEqual(pages, [['host0', 'host1'], ['host2', 'host3'], ['host4']])
+        self.assertEqual(len(self.names('nagios_cache_hosts', limit=0)), 5)
+
+    def test_encoding(self):
+        row = self.get(reverse('nagios_cache_services'))['results'][0]
+        self.assertEqual((row['host_name'], row['service_description'], row['status'], row['state_type'], row['duration']),
+                         ('host0', 'ping', 'CRITICAL', 'HARD', 3600))
+
+    def test_filters(self):
+        self.assertEqual(self.names('nagios_cache_hosts', status='down'), ['host3'])
+        self.assertEqual(self.names('nagios_cache_hosts', hostgroup='web'), ['host1', 'host3'])
+        self.assertEqual(self.names('nagios_cache_services', servicegroup='ping'), ['host0'])
+        self.assertEqual(self.names('nagios_cache_host_problems'), ['host3'])
+        self.assertEqual(self.names('nagios_cache_service_problems'), ['host0'])
+        self.assertEqual(self.names('nagios_cache_hosts', status='unknown status'), [])
+
+    def test_bad_request(self):
+        self.assertEqual(self.client.get(reverse('nagios_cache_hosts'), {'limit': 'all'}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('nagios_cache_hosts')).status_code, 405)
+
+    def test_not_modified(self):
+        url = reverse('nagios_cache_hosts')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another page has another ETag
+        self.assertEqual(self.client.get(url, {'limit': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # What bump_generation() does when a sync is committed
+        get_cache().incr(GENERATION_KEY)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CachedQueryTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_none_is_cached(self):
+        with self.assertNumQueries(2):
+            self.assertIsNone(queries.last_database_update())
+        with self.assertNumQueries(0):
+            self.assertIsNone(queries.last_database_update())
+
+
+class ServiceImportTest(TestCase):
+    """
+    The services are written with bulk queries, so the number of queries does not grow with every service.
+    SQLite limits the parameters of a query, so its bulk queries are split every few dozen rows.
+    """
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.host = create_host('host', self.now)
+
+    def import_services(self, count, status='OK'):
+        rows = [nagios_service('host', 'service%s' % i, status=status) for i in range(count)]
+        return count_queries(NagiosServiceStatus.import_rows, rows, self.now, prepare=NagiosServiceStatus.host_lookup())
+
+    def test_create(self):
+        # Preloads, inserts, the primary keys and the inserts of the transitions
+        self.assertLessEqual(self.import_services(100), 20)
+        self.assertEqual(NagiosServiceStatus.objects.count(), 100)
+
+    def test_update(self):
+        self.import_services(100)
+        # Preloads, updates and the inserts of the transitions
+        self.assertLessEqual(self.import_services(100, status='CRITICAL'), 20)
+        self.assertEqual(NagiosServiceStatus.objects.filter(status=NagiosStatus.STATUS_CRITICAL).count(), 100)
+
+
+@override_settings(NAGIOS_CACHE_STREAMING=False)
+class HostImportTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+
+    def import_hosts(self, hosts, current_time):
+        self.session.get.return_value = status_response({'status': {'host_status': hosts}})
+        return count_queries(NagiosHostStatus.import_all, current_time)
+
+    def test_import_all(self):
+        hosts = [nagios_host('host%s' % i) for i in range(100)]
+        # The sync state, the preloads, the inserts and the transitions, not one query per host
+        self.assertLessEqual(self.import_hosts(hosts, self.now), 20)
+        self.assertEqual(NagiosHostStatus.objects.count(), 100)
+        ids = dict(NagiosHostStatus.objects.values_list('host_name', 'id'))
+        hosts[0] = nagios_host('host0', status='DOWN')
+        later = self.now + timedelta(minutes=1)
+        self.assertLessEqual(self.import_hosts(hosts, later), 20)
+        self.assertEqual(dict(NagiosHostStatus.objects.values_list('host_name', 'id')), ids)
+        self.assertEqual(NagiosHostStatus.objects.get(host_name='host0').status, NagiosStatus.STATUS_DOWN)
+        self.assertEqual(NagiosHostStatus.objects.filter(last_database_update=later).count(), 100)
+
+
+@skipUnless(ijson is not None, 'Streaming needs ijson')
+@override_settings(NAGIOS_CACHE_STREAMING=True, NAGIOS_CACHE_BATCH_SIZE=100)
+class StreamingImportTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('nagios_cache.models.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        # Larger than the read buffer of ijson
+        self.body = json.dumps({'status': {'host_status': [nagios_host('host%s' % i) for i in range(500)]}}).encode('utf-8')
+        self.raw = io.BytesIO(self.body)
+        self.session.get.return_value = mock.Mock(status_code=200, headers={}, raw=self.raw)
+
+    def test_batches(self):
+        bulk_save = NagiosHostStatus.bulk_save
+        saved = []
+
+        def save(objs):
+            saved.append((len(objs), self.raw.tell()))
+            bulk_save(objs)
+        with mock.patch.object(NagiosHostStatus, 'bulk_save', side_effect=save):
+            NagiosHostStatus.import_all(timezone.now())
+        self.assertTrue(self.session.get.call_args[1]['stream'])
+        self.assertEqual([count for count, position in saved], [100] * 5)
+        # The first batch is written before the response is read completely
+        self.assertLess(saved[0][1], len(self.body))
+        self.assertEqual(NagiosHostStatus.objects.count(), 500)
@@ -0,0 +1,17 @@
+
+
+try:
+    from django.urls import re_path
+except ImportError:  # Django < 2.0
+    from django.conf.urls import url as re_path
+
+from nagios_cache import views
+
+urlpatterns = [
+    re_path(r'^hosts/$', views.hosts, name='nagios_cache_hosts'),
+    re_path(r'^services/$', views.services, name='nagios_cache_services'),
+    re_path(r'^hostgroups/$', views.hostgroups, name='nagios_cache_hostgroups'),
+    re_path(r'^servicegroups/$', views.servicegroups, name='nagios_cache_servicegroups'),
+    re_path(r'^problems/hosts/$', views.host_problems, name='nagios_cache_host_problems'),
+    re_path(r'^problems/services/$', views.service_problems, name='nagios_cache_service_problems'),
+]
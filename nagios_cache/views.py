@@ -0,0 +1,145 @@
+
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.http import condition, require_safe
+
+from nagios_cache import queries
+from nagios_cache.cache import get_generation
+from nagios_cache.models import NagiosStatus, NagiosHostStatus, NagiosServiceStatus, NagiosHostgroup, NagiosServicegroup
+
+STATUS_NAMES = dict(NagiosStatus.STATUS)
+STATE_TYPE_NAMES = dict(NagiosStatus.STATE_TYPE)
+
+HOST_FIELDS = ['id', 'source', 'host_name', 'host_display_name', 'status', 'state_type', 'attempts', 'attempts_of',
+               'duration', 'last_check', 'has_been_acknowledged', 'in_scheduled_downtime', 'is_flapping',
+               'status_information', 'last_database_update']
+SERVICE_FIELDS = HOST_FIELDS[:4] + ['service_description', 'service_display_name'] + HOST_FIELDS[4:]
+GROUP_FIELDS = ['id', 'source', 'name', 'last_database_update']
+
+
+def sync_etag(request, *args, **kwargs):
+    """
+    The ETag of every response. It changes with the sync generation, so a client that sends it back
+    gets a 304 Not Modified until the next sync without a database query.
+    """
+    value = '%s:%s:%s' % (get_generation(), queries.last_database_update(), request.get_full_path())
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def api_view(func):
+    """
+    A read only API view with conditional responses, see sync_etag()
+    """
+    return require_safe(condition(etag_func=sync_etag)(func))
+
+
+def encode_row(row):
+    if 'status' in row:
+        row['status'] = STATUS_NAMES[row['status']]
+    if 'state_type' in row:
+        row['state_type'] = STATE_TYPE_NAMES[row['state_type']]
+    if 'duration' in row:
+        row['duration'] = int(row['duration'].total_seconds())
+    return json.dumps(row, cls=DjangoJSONEncoder)
+
+
+def paginated_response(request, query, fields):
+    """
+    Stream one page of query as {"results": [...], "next": url}. The pages are cursor based: ?after=<id> returns
+    the entries after the last one of the previous page, so no page has to count or skip rows.
+    ?limit=0 streams all entries at once.
+    """
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = int(request.GET.get('limit', settings.NAGIOS_CACHE_API_PAGE_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest('after and limit must be integers')
+    query = query.filter(pk__gt=after).order_by('pk').values(*fields)
+    if limit > 0:
+        query = query[:limit]
+
+    def content():
+        yield '{"results": ['
+        count = 0
+        last = None
+        for row in query.iterator():
+            if count:
+                yield ', '
+            last = row['id']
+            count += 1
+            yield encode_row(row)
+        next_url = None
+        if limit > 0 and count == limit:
+            params = request.GET.copy()
+            params['after'] = last
+            next_url = '%s?%s' % (request.path, params.urlencode())
+        yield '], "next": %s}' % json.dumps(next_url)
+    return StreamingHttpResponse(content(), content_type='application/json')
+
+
+def filter_query(request, query, filters):
+    """
+    Apply the GET parameters of request that are in filters, a dict parameter -> lookup
+    """
+    for name, lookup in filters.items():
+        if name in request.GET:
+            value = request.GET[name]
+            if lookup == 'status':
+                value = NagiosStatus.STATUS_CODES.get(value.upper(), 0)
+            elif lookup == 'state_type':
+                value = NagiosStatus.STATE_TYPE_CODES.get(value.upper(), 0)
+            query = query.filter(**{lookup: value})
+    return query
+
+
+@api_view
+def hosts(request):
+    query = filter_query(request, NagiosHostStatus.objects.all(), {
+        'source': 'source', 'host_name': 'host_name', 'status': 'status', 'state_type': 'state_type',
+        'hostgroup': 'nagioshostgroup__name',
+    })
+    return paginated_response(request, query, HOST_FIELDS)
+
+
+@api_view
+def services(request):
+    query = filter_query(request, NagiosServiceStatus.objects.all(), {
+        'source': 'source', 'host_name': 'host_name', 'service_description': 'service_description',
+        'status': 'status', 'state_type': 'state_type', 'hostgroup': 'host__nagioshostgroup__name',
+        'servicegroup': 'nagiosservicegroup__name',
+    })
+    return paginated_response(request, query, SERVICE_FIELDS)
+
+
+@api_view
+def hostgroups(request):
+    query = filter_query(request, NagiosHostgroup.objects.all(), {'source': 'source'})
+    return paginated_response(request, query, GROUP_FIELDS)
+
+
+@api_view
+def servicegroups(request):
+    query = filter_query(request, NagiosServicegroup.objects.all(), {'source': 'source'})
+    return paginated_response(request, query, GROUP_FIELDS)
+
+
+@api_view
+def host_problems(request):
+    query = filter_query(request, NagiosHostStatus.objects.filter(status__in=queries.PROBLEM_STATUS), {
+        'source': 'source', 'state_type': 'state_type', 'hostgroup': 'nagioshostgroup__name',
+    })
+    return paginated_response(request, query, HOST_FIELDS)
+
+
+@api_view
+def service_problems(request):
+    query = filter_query(request, NagiosServiceStatus.objects.filter(status__in=queries.PROBLEM_STATUS), {
+        'source': 'source', 'state_type': 'state_type', 'hostgroup': 'host__nagioshostgroup__name',
+        'servicegroup': 'nagiosservicegroup__name',
+    })
+    return paginated_response(request, query, SERVICE_FIELDS)